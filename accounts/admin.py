@@ -1,7 +1,7 @@
 # Admin configuration for accounts app
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Subscription, APIKey, APIUsage, UsageQuota
+from .models import User, Subscription, APIKey, APIUsage, APIUsageDaily, UsageQuota
 
 
 @admin.register(User)
@@ -49,12 +49,26 @@ class APIKeyAdmin(admin.ModelAdmin):
 
 @admin.register(APIUsage)
 class APIUsageAdmin(admin.ModelAdmin):
-    """API Usage admin"""
-    list_display = ('api_key', 'endpoint', 'method', 'response_status', 'timestamp')
-    list_filter = ('method', 'response_status', 'timestamp')
+    """API Usage admin (individual requests; daily totals are in APIUsageDailyAdmin)"""
+    list_display = ('api_key', 'endpoint', 'method', 'response_status', 'response_time_ms', 'cache_source', 'timestamp')
+    list_filter = ('method', 'response_status', 'cache_source', 'timestamp')
     search_fields = ('api_key__user__email', 'endpoint')
     readonly_fields = ('timestamp',)
-    date_hierarchy = 'timestamp'
+    show_full_result_count = False  # Skip the extra COUNT(*) over the whole raw table
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('api_key__user')
+
+
+@admin.register(APIUsageDaily)
+class APIUsageDailyAdmin(admin.ModelAdmin):
+    """Daily API usage rollup admin (built by the rollup_api_usage command)"""
+    list_display = ('date', 'api_key', 'endpoint', 'response_status', 'request_count',
+                    'p50_response_time_ms', 'p95_response_time_ms', 'p99_response_time_ms')
+    list_filter = ('response_status', 'date')
+    search_fields = ('api_key__user__email', 'endpoint')
+    readonly_fields = ('updated_at',)
+    date_hierarchy = 'date'
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('api_key__user')
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import APIUsage, APIUsageDaily
+from datetime import datetime, time, timedelta
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Aggregate raw API usage into daily rollups and prune old raw rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=getattr(settings, 'API_USAGE_RETENTION_DAYS', 30),
+            help='Delete raw API usage rows older than this many days (default: API_USAGE_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--no-prune',
+            action='store_true',
+            help='Only aggregate, keep all raw rows'
+        )
+
+    def handle(self, *args, **options):
+        retention_days = max(options['retention_days'], 1)
+        today = timezone.localdate()
+
+        # The newest rolled-up day may have been partial, so it is rebuilt;
+        # older days are final
+        start_day = APIUsageDaily.objects.order_by('-date').values_list('date', flat=True).first()
+        if start_day is None:
+            first_usage = APIUsage.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+            if first_usage is None:
+                self.stdout.write('No API usage to roll up')
+                return
+            start_day = timezone.localtime(first_usage).date()
+
+        day = start_day
+        total_rows = 0
+        while day <= today:
+            total_rows += self.rollup_day(day)
+            day += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {total_rows} usage records from {start_day} to {today}"
+        ))
+
+        if options['no_prune']:
+            return
+
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        deleted, _ = APIUsage.objects.filter(timestamp__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} raw usage records older than {retention_days} days"
+        ))
+        logger.info(f"API usage rollup: {total_rows} rows aggregated, {deleted} raw rows pruned")
+
+    def rollup_day(self, day):
+        """Rebuild the rollup rows for one local calendar day"""
+        day_start = timezone.make_aware(datetime.combine(day, time.min))
+        day_end = day_start + timedelta(days=1)
+
+        groups = {}
+        rows = (
+            APIUsage.objects
+            .filter(timestamp__gte=day_start, timestamp__lt=day_end)
+            .values_list('api_key_id', 'endpoint', 'response_status', 'response_time_ms', 'response_size')
+        )
+        count = 0
+        for api_key_id, endpoint, response_status, response_time_ms, response_size in rows.iterator():
+            group = groups.setdefault((api_key_id, endpoint, response_status), {'count': 0, 'times': [], 'size': 0})
+            group['count'] += 1
+            group['size'] += response_size or 0
+            if response_time_ms is not None:
+                group['times'].append(response_time_ms)
+            count += 1
+
+        rollups = []
+        for (api_key_id, endpoint, response_status), group in groups.items():
+            times = sorted(group['times'])
+            rollups.append(APIUsageDaily(
+                api_key_id=api_key_id,
+                date=day,
+                endpoint=endpoint,
+                response_status=response_status,
+                request_count=group['count'],
+                p50_response_time_ms=percentile(times, 50),
+                p95_response_time_ms=percentile(times, 95),
+                p99_response_time_ms=percentile(times, 99),
+                total_response_size=group['size'],
+            ))
+
+        with transaction.atomic():
+            APIUsageDaily.objects.filter(date=day).delete()
+            APIUsageDaily.objects.bulk_create(rollups)
+        return count
@@ -1,11 +1,127 @@
 # API Key Authentication Middleware
+from django.conf import settings
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
 from django.utils import timezone
-from accounts.models import APIKey, APIUsage, UsageQuota
+from accounts.models import APIKey, APIUsage
+from accounts.quota import quota_counter
+from accounts.ratelimit import rate_limiter
+from accounts.usage import usage_recorder
+from collections import OrderedDict, namedtuple
+import threading
+import time
 import json
 
 
+# What the middleware needs to know about a key, without touching the database
+ResolvedAPIKey = namedtuple('ResolvedAPIKey', ['key_id', 'user_id', 'plan', 'monthly_limit', 'is_active'])
+
+
+class APIKeyCache:
+    """
+    Bounded, TTL-based in-process cache of resolved API keys.
+
+    Entries are dropped by the signal handlers in accounts/signals.py whenever
+    an APIKey or Subscription changes, so the TTL only bounds how long other
+    worker processes can keep serving a stale entry.
+    """
+
+    def __init__(self, ttl=60, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached ResolvedAPIKey for a raw key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, resolved):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, resolved)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None, user_id=None):
+        """Drop a single key, or every key belonging to a user"""
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            if user_id is not None:
+                for cached_key in [k for k, (_, r) in self._entries.items() if r.user_id == user_id]:
+                    del self._entries[cached_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters; every hit is an auth lookup that skipped the database"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'size': len(self._entries),
+                'ttl': self.ttl,
+                'max_entries': self.max_entries,
+            }
+
+
+api_key_cache = APIKeyCache(
+    ttl=getattr(settings, 'API_KEY_CACHE_TTL', 60),
+    max_entries=getattr(settings, 'API_KEY_CACHE_MAX_ENTRIES', 1000),
+)
+
+
+def resolve_api_key(key):
+    """
+    Resolve a raw API key to a ResolvedAPIKey, using the in-process cache.
+
+    Raises APIKey.DoesNotExist for unknown or inactive keys.
+    """
+    resolved = api_key_cache.get(key)
+    if resolved is not None:
+        return resolved
+
+    api_key_obj = APIKey.objects.select_related('user__subscription').get(key=key, is_active=True)
+    user = api_key_obj.user
+    try:
+        subscription = user.subscription
+    except Exception:
+        # User doesn't have a subscription, create a default free one
+        from accounts.models import Subscription
+        subscription = Subscription.objects.create(
+            user=user,
+            plan='free',
+            is_active=True
+        )
+
+    resolved = ResolvedAPIKey(
+        key_id=api_key_obj.pk,
+        user_id=user.pk,
+        plan=subscription.plan,
+        monthly_limit=subscription.monthly_limit,
+        is_active=subscription.is_active,
+    )
+    api_key_cache.set(key, resolved)
+    return resolved
+
+
 class APIKeyMiddleware(MiddlewareMixin):
     """
     Middleware to authenticate API requests using API keys
@@ -42,59 +158,54 @@ class APIKeyMiddleware(MiddlewareMixin):
             }, status=401)
             
         try:
-            # Validate API key
-            api_key_obj = APIKey.objects.get(key=api_key, is_active=True)
-            user = api_key_obj.user
+            # Validate API key (served from the in-process cache when possible)
+            resolved = resolve_api_key(api_key)
             
-            # Check if user's subscription exists and is active
-            try:
-                subscription = user.subscription
-                if not subscription.is_active:
-                    return JsonResponse({
-                        'error': 'Subscription inactive',
-                        'message': 'Your subscription is not active'
-                    }, status=403)
-            except:                # User doesn't have a subscription, create a default free one
-                from accounts.models import Subscription
-                subscription = Subscription.objects.create(
-                    user=user,
-                    plan='free',
-                    is_active=True
-                )
+            # Check if user's subscription is active
+            if not resolved.is_active:
+                return JsonResponse({
+                    'error': 'Subscription inactive',
+                    'message': 'Your subscription is not active'
+                }, status=403)
             
-            # Check monthly quota
-            now = timezone.now()
-            current_quota, created = UsageQuota.objects.get_or_create(
-                user=user,
-                year=now.year,
-                month=now.month,
-                defaults={'usage_count': 0}
-            )
+            # Per-key rate limit (token bucket, no database access)
+            rate_limit = rate_limiter.consume(resolved.key_id, resolved.plan)
+            request.rate_limit = rate_limit
+            if not rate_limit.allowed:
+                response = JsonResponse({
+                    'error': 'Rate limit exceeded',
+                    'message': f'Too many requests. Retry in {rate_limit.retry_after} seconds'
+                }, status=429)
+                response['Retry-After'] = str(rate_limit.retry_after)
+                return response
             
-            if current_quota.usage_count >= subscription.monthly_limit:
+            # Check monthly quota (synced value plus this process's unsynced increments)
+            now = timezone.now()
+            if quota_counter.usage(resolved.user_id, now) >= resolved.monthly_limit:
                 return JsonResponse({
                     'error': 'Quota exceeded',
-                    'message': f'Monthly limit of {subscription.monthly_limit} requests exceeded'
+                    'message': f'Monthly limit of {resolved.monthly_limit} requests exceeded'
                 }, status=429)
-                  # Track usage
-            APIUsage.objects.create(
-                api_key=api_key_obj,
+            
+            # Track usage; status, latency and size are filled in by process_response
+            request.api_usage = APIUsage(
+                api_key_id=resolved.key_id,
                 endpoint=request.path,
                 method=request.method,
-                response_status=200  # We'll assume success at this point
+                timestamp=now
             )
+            request.api_usage_started = time.monotonic()
             
-            # Update quota usage
-            current_quota.usage_count += 1
-            current_quota.save()
+            # Update quota usage (merged into UsageQuota in the background)
+            quota_counter.increment(resolved.user_id, now)
+            request.api_quota_charge = (resolved.user_id, now)
             
-            # Update API key last used
-            api_key_obj.last_used = timezone.now()
-            api_key_obj.save(update_fields=['last_used'])
+            # Update API key last used (coalesced per key and written by the usage flusher)
+            usage_recorder.touch(resolved.key_id, now)
             
-            # Add user to request for use in views
-            request.api_user = user
-            request.api_key = api_key_obj
+            # Add user to request for use in views (loaded only if a view asks for it)
+            request.api_key = SimpleLazyObject(lambda: APIKey.objects.select_related('user').get(pk=resolved.key_id))
+            request.api_user = SimpleLazyObject(lambda: request.api_key.user)
             
             return None
             
@@ -109,6 +220,48 @@ class APIKeyMiddleware(MiddlewareMixin):
                 'message': f'An error occurred during authentication: {str(e)}'
             }, status=500)
     
+    def process_exception(self, request, exception):
+        # Django turns the exception into a 500 response that still passes
+        # through process_response, which records it
+        if getattr(request, 'api_usage', None) is not None:
+            request.api_usage.cache_source = 'error'
+        return None
+    
+    def process_response(self, request, response):
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            response['X-RateLimit-Limit'] = str(rate_limit.limit)
+            response['X-RateLimit-Remaining'] = str(rate_limit.remaining)
+            response['X-RateLimit-Reset'] = str(rate_limit.reset)
+        
+        usage = getattr(request, 'api_usage', None)
+        if usage is not None:
+            request.api_usage = None  # Record each request once
+            usage.response_status = response.status_code
+            usage.response_time_ms = round((time.monotonic() - request.api_usage_started) * 1000, 2)
+            if not response.streaming:
+                usage.response_size = len(response.content)
+            if response.status_code == 304:
+                # Revalidations are recorded under their own source and, unless
+                # configured otherwise, don't count against the monthly quota
+                usage.cache_source = 'not-modified'
+                charge = getattr(request, 'api_quota_charge', None)
+                if charge and not getattr(settings, 'API_QUOTA_COUNT_NOT_MODIFIED', False):
+                    quota_counter.increment(*charge, count=-1)
+            if not usage.cache_source:
+                usage.cache_source = self.get_cache_source(response)
+            usage_recorder.record(usage)
+        return response
+    
+    def get_cache_source(self, response):
+        """The source a view reported in X-Data-Source or its payload, if any"""
+        if response.has_header('X-Data-Source'):
+            return response['X-Data-Source'][:20]
+        data = getattr(response, 'data', None)
+        if isinstance(data, dict) and isinstance(data.get('source'), str):
+            return data['source'][:20]
+        return ''
+    
     def get_client_ip(self, request):
         """Get the client's IP address"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
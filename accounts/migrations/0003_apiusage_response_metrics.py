@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_apiusage_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiusage',
+            name='cache_source',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='apiusage',
+            name='response_size',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apiusage',
+            name='response_time_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
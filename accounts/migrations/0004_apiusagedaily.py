@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_apiusage_response_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIUsageDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('endpoint', models.CharField(max_length=200)),
+                ('response_status', models.IntegerField()),
+                ('request_count', models.IntegerField(default=0)),
+                ('p50_response_time_ms', models.FloatField(blank=True, null=True)),
+                ('p95_response_time_ms', models.FloatField(blank=True, null=True)),
+                ('p99_response_time_ms', models.FloatField(blank=True, null=True)),
+                ('total_response_size', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='accounts.apikey')),
+            ],
+            options={
+                'verbose_name_plural': 'API usage (daily)',
+                'indexes': [models.Index(fields=['api_key', 'date'], name='accounts_ap_api_key_a849e5_idx'), models.Index(fields=['date'], name='accounts_ap_date_650080_idx')],
+                'unique_together': {('api_key', 'date', 'endpoint', 'response_status')},
+            },
+        ),
+    ]
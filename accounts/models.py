@@ -29,6 +29,13 @@ class Subscription(models.Model):
         'business': 500000,
     }
     
+    # Token bucket per API key: sustained requests per second and burst size
+    PLAN_RATE_LIMITS = {
+        'free': {'rate': 1, 'burst': 10},
+        'developer': {'rate': 10, 'burst': 50},
+        'business': {'rate': 25, 'burst': 100},
+    }
+    
     PLAN_PRICES = {
         'free': 0,
         'developer': 49,
@@ -101,7 +108,10 @@ class APIUsage(models.Model):
     endpoint = models.CharField(max_length=200)
     method = models.CharField(max_length=10)
     response_status = models.IntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    response_time_ms = models.FloatField(null=True, blank=True)  # Wall-clock time spent in the view
+    response_size = models.IntegerField(null=True, blank=True)  # Body size in bytes
+    cache_source = models.CharField(max_length=20, blank=True)  # 'source' reported by the view, e.g. cache or mse.co.mw
+    timestamp = models.DateTimeField(default=timezone.now)  # Set by the middleware; rows are written later in batches
     
     class Meta:
         indexes = [
@@ -113,6 +123,31 @@ class APIUsage(models.Model):
         return f"{self.api_key.user.email} - {self.endpoint} - {self.timestamp}"
 
 
+class APIUsageDaily(models.Model):
+    """Daily rollup of APIUsage per key, endpoint and status"""
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='daily_usage')
+    date = models.DateField()
+    endpoint = models.CharField(max_length=200)
+    response_status = models.IntegerField()
+    request_count = models.IntegerField(default=0)
+    p50_response_time_ms = models.FloatField(null=True, blank=True)
+    p95_response_time_ms = models.FloatField(null=True, blank=True)
+    p99_response_time_ms = models.FloatField(null=True, blank=True)
+    total_response_size = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'API usage (daily)'
+        unique_together = ['api_key', 'date', 'endpoint', 'response_status']
+        indexes = [
+            models.Index(fields=['api_key', 'date']),
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.api_key_id} - {self.date} - {self.endpoint} [{self.response_status}] x{self.request_count}"
+
+
 class UsageQuota(models.Model):
     """Monthly usage tracking"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_quotas')
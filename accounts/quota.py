@@ -0,0 +1,145 @@
+# In-memory monthly quota counting, merged into UsageQuota in the background
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaCounter:
+    """
+    Sharded in-memory request counters for the monthly UsageQuota.
+
+    Increments land in a per-process shard and are merged into UsageQuota
+    with ``F('usage_count') + n`` every ``sync_interval`` seconds, or inline
+    once a user has ``max_unsynced`` pending increments. Quota checks read
+    the last synced value plus the local pending count, so each worker can
+    admit at most ``max_unsynced`` requests beyond the limit before it
+    syncs, and never trusts a synced value older than ``sync_interval``.
+    """
+
+    def __init__(self, shards=16, sync_interval=5.0, max_unsynced=50):
+        self.sync_interval = sync_interval
+        self.max_unsynced = max(max_unsynced, 1)
+        self._shards = [(threading.Lock(), {}) for _ in range(max(shards, 1))]
+        self._synced = {}  # (user_id, year, month) -> (usage_count, monotonic time of sync)
+        self._sync_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    @staticmethod
+    def _period_key(user_id, now=None):
+        now = now or timezone.now()
+        return (user_id, now.year, now.month)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _pending(self, key):
+        lock, counts = self._shard(key)
+        with lock:
+            return counts.get(key, 0)
+
+    def usage(self, user_id, now=None):
+        """Current month's usage as seen by this process"""
+        key = self._period_key(user_id, now)
+        synced = self._synced.get(key)
+        if synced is None or time.monotonic() - synced[1] > self.sync_interval:
+            self._load(key)
+            synced = self._synced[key]
+        return synced[0] + self._pending(key)
+
+    def increment(self, user_id, now=None, count=1):
+        """Count requests against the month of `now`; a negative count refunds them"""
+        key = self._period_key(user_id, now)
+        self._ensure_started()
+        lock, counts = self._shard(key)
+        with lock:
+            counts[key] = counts.get(key, 0) + count
+            pending = counts[key]
+        if pending >= self.max_unsynced:
+            self.sync(key)
+
+    def sync(self, only_key=None):
+        """Merge pending increments into UsageQuota; returns the number merged"""
+        merged = 0
+        with self._sync_lock:
+            for lock, counts in self._shards:
+                with lock:
+                    if only_key is not None:
+                        batch = {only_key: counts.pop(only_key)} if only_key in counts else {}
+                    else:
+                        batch = dict(counts)
+                        counts.clear()
+                for key, count in batch.items():
+                    try:
+                        self._apply(key, count)
+                        merged += count
+                    except Exception as e:
+                        logger.error(f"Failed to sync {count} quota increments for user {key[0]}: {e}")
+        return merged
+
+    def _apply(self, key, count):
+        from accounts.models import UsageQuota
+
+        user_id, year, month = key
+        quota = UsageQuota.objects.filter(user_id=user_id, year=year, month=month)
+        if not quota.update(usage_count=F('usage_count') + count, updated_at=timezone.now()):
+            UsageQuota.objects.get_or_create(user_id=user_id, year=year, month=month, defaults={'usage_count': 0})
+            quota.update(usage_count=F('usage_count') + count, updated_at=timezone.now())
+        self._synced[key] = (quota.values_list('usage_count', flat=True).first() or 0, time.monotonic())
+
+    def _load(self, key):
+        from accounts.models import UsageQuota
+
+        user_id, year, month = key
+        quota, created = UsageQuota.objects.get_or_create(
+            user_id=user_id,
+            year=year,
+            month=month,
+            defaults={'usage_count': 0}
+        )
+        self._synced[key] = (quota.usage_count, time.monotonic())
+
+    def shutdown(self):
+        """Stop the sync thread and merge whatever is left"""
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.sync()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    daemon=True,
+                    name="MSE-QuotaSync"
+                )
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stopping:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Error in quota sync loop: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+
+quota_counter = QuotaCounter(
+    shards=getattr(settings, 'API_QUOTA_SHARDS', 16),
+    sync_interval=getattr(settings, 'API_QUOTA_SYNC_INTERVAL', 5),
+    max_unsynced=getattr(settings, 'API_QUOTA_MAX_OVERSHOOT', 50),
+)
@@ -0,0 +1,72 @@
+# Per-API-key token bucket rate limiting
+from django.conf import settings
+from django.core.cache import caches
+from accounts.models import Subscription
+from collections import namedtuple
+import math
+import threading
+import time
+
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per API key, refilled at the plan's rate up to its burst size.
+
+    Bucket state lives in the cache alias named by ``RATE_LIMIT_CACHE`` so all
+    workers sharing that backend share the same buckets. The read-modify-write
+    is not atomic across processes; concurrent requests on different workers
+    can each spend the same token, which only matters at the burst edge.
+    """
+
+    def __init__(self, cache_alias='ratelimit', plan_limits=None):
+        self.cache_alias = cache_alias
+        self.plan_limits = plan_limits or Subscription.PLAN_RATE_LIMITS
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def limits_for(self, plan):
+        limits = self.plan_limits.get(plan) or self.plan_limits['free']
+        return limits['rate'], limits['burst']
+
+    def consume(self, key_id, plan):
+        """Take one token from the key's bucket"""
+        rate, burst = self.limits_for(plan)
+        cache_key = f"ratelimit:{key_id}"
+
+        with self._lock:
+            # Read the clock under the lock: a request that waited for it must
+            # not apply its earlier timestamp to a newer bucket, which would
+            # refill by a negative amount and take tokens away
+            now = time.time()
+            state = self.cache.get(cache_key)
+            if state is None:
+                tokens = float(burst)
+            else:
+                tokens, updated = state
+                # Clocks of workers sharing a backend can disagree, too
+                tokens = min(float(burst), tokens + max(0.0, now - updated) * rate)
+                now = max(now, updated)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            # Keep the bucket around only as long as it takes to refill
+            self.cache.set(cache_key, (tokens, now), math.ceil(burst / rate) + 1)
+
+        return RateLimitResult(
+            allowed=allowed,
+            limit=burst,
+            remaining=int(tokens),
+            reset=math.ceil((burst - tokens) / rate),
+            retry_after=0 if allowed else math.ceil((1 - tokens) / rate),
+        )
+
+
+rate_limiter = TokenBucketLimiter(cache_alias=getattr(settings, 'RATE_LIMIT_CACHE', 'ratelimit'))
@@ -1,8 +1,8 @@
 # Signals for automatic subscription creation
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Subscription
+from .models import Subscription, APIKey
 
 User = get_user_model()
 
@@ -15,3 +15,17 @@ def create_user_subscription(sender, instance, created, **kwargs):
             user=instance,
             defaults={'plan': 'free'}
         )
+
+
+@receiver([post_save, post_delete], sender=APIKey)
+def invalidate_api_key_cache(sender, instance, **kwargs):
+    """Drop a changed or deleted key from the middleware's API key cache"""
+    from .middleware import api_key_cache
+    api_key_cache.invalidate(key=instance.key)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_subscription_cache(sender, instance, **kwargs):
+    """Plan or status changes affect every cached key of the subscriber"""
+    from .middleware import api_key_cache
+    api_key_cache.invalidate(user_id=instance.user_id)
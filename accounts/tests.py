@@ -0,0 +1,362 @@
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.http import HttpResponse, HttpResponseNotModified
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+from django.utils import timezone
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from datetime import datetime, time as dt_time, timedelta
+from unittest import mock
+import io
+import time
+
+from .middleware import APIKeyCache, resolve_api_key
+from .models import APIKey, APIUsage, APIUsageDaily, UsageQuota, User
+from .quota import QuotaCounter
+from .ratelimit import TokenBucketLimiter
+from .usage import UsageRecorder
+
+
+def _header_source_view(request):
+    time.sleep(0.01)
+    return HttpResponse(b'x' * 100, headers={'X-Data-Source': 'cache'})
+
+
+@api_view(['GET'])
+def _payload_source_view(request):
+    return Response({'source': 'mse.co.mw', 'stock_prices': []})
+
+
+def _not_modified_view(request):
+    return HttpResponseNotModified()
+
+
+def _broken_view(request):
+    raise ValueError('boom')
+
+
+# Used with override_settings(ROOT_URLCONF=__name__) by the usage recording tests
+urlpatterns = [
+    path('api/test/header/', _header_source_view),
+    path('api/test/payload/', _payload_source_view),
+    path('api/test/not-modified/', _not_modified_view),
+    path('api/test/broken/', _broken_view),
+]
+
+
+class APIKeyTestCase(TestCase):
+    """
+    Fresh middleware singletons per test, with the background flush and
+    sync threads kept from starting so everything runs on the test thread
+    """
+
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.key_cache = APIKeyCache(ttl=60)
+        self.recorder = UsageRecorder(flush_interval=60, batch_size=100, max_pending=1000)
+        self.quota = QuotaCounter(sync_interval=60, max_unsynced=50)
+        self.limiter = TokenBucketLimiter()
+        for patcher in (
+            mock.patch.object(UsageRecorder, '_ensure_started'),
+            mock.patch.object(QuotaCounter, '_ensure_started'),
+            mock.patch('accounts.middleware.api_key_cache', self.key_cache),
+            mock.patch('accounts.middleware.usage_recorder', self.recorder),
+            mock.patch('accounts.middleware.quota_counter', self.quota),
+            mock.patch('accounts.middleware.rate_limiter', self.limiter),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create(username='trader', email='trader@example.com')
+        self.api_key = APIKey.objects.create(user=self.user, name='test')
+
+    def get(self, path='/api/market-status/', **headers):
+        return self.client.get(path, HTTP_X_API_KEY=self.api_key.key, **headers)
+
+
+class APIKeyCacheTests(APIKeyTestCase):
+    def test_repeat_lookups_skip_the_database(self):
+        resolve_api_key(self.api_key.key)
+        with self.assertNumQueries(0):
+            resolved = resolve_api_key(self.api_key.key)
+
+        self.assertEqual((resolved.key_id, resolved.plan), (self.api_key.pk, 'free'))
+        stats = self.key_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+    def test_deleted_key_is_rejected_on_the_next_request(self):
+        self.assertEqual(self.get().status_code, 200)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('delete_api_key', args=[self.api_key.pk]))
+
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_plan_change_applies_on_the_next_request(self):
+        self.assertEqual(self.get()['X-RateLimit-Limit'], '10')
+
+        subscription = self.user.subscription
+        subscription.plan = 'developer'
+        subscription.save()
+        self.assertEqual(self.get()['X-RateLimit-Limit'], '50')
+
+        subscription.is_active = False
+        subscription.save()
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_last_used_is_written_by_the_flusher(self):
+        self.get()
+        self.api_key.refresh_from_db()
+        self.assertIsNone(self.api_key.last_used)
+
+        second = self.recorder._last_used[self.api_key.pk] + timedelta(seconds=5)
+        self.recorder.touch(self.api_key.pk, second)
+        self.recorder.touch(self.api_key.pk, second - timedelta(seconds=1))
+        with self.assertNumQueries(2):  # Usage rows and last_used, one statement each
+            self.recorder.flush()
+
+        self.api_key.refresh_from_db()
+        self.assertEqual(self.api_key.last_used, second)
+
+
+class UsageRecorderTests(APIKeyTestCase):
+    def usage(self, count):
+        return [APIUsage(api_key=self.api_key, endpoint='/api/latest/', method='GET', response_status=200)
+                for _ in range(count)]
+
+    def record(self, recorder, count):
+        for usage in self.usage(count):
+            recorder.record(usage)
+
+    def test_flush_writes_in_batches(self):
+        recorder = UsageRecorder(batch_size=3, max_pending=100)
+        self.record(recorder, 3)
+        self.assertTrue(recorder._wakeup.is_set())  # A full batch wakes the flusher
+        self.record(recorder, 4)
+
+        with mock.patch.object(APIUsage.objects, 'bulk_create', wraps=APIUsage.objects.bulk_create) as bulk_create:
+            self.assertEqual(recorder.flush(), 7)
+
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [3, 3, 1])
+        self.assertEqual((APIUsage.objects.count(), recorder.flushed, recorder.pending()), (7, 7, 0))
+
+    def test_request_that_fills_the_queue_flushes_inline(self):
+        recorder = UsageRecorder(batch_size=2, max_pending=5)
+        self.record(recorder, 4)
+        self.assertEqual((recorder.pending(), APIUsage.objects.count()), (4, 0))
+
+        self.record(recorder, 1)
+        self.assertEqual((recorder.pending(), APIUsage.objects.count()), (0, 5))
+
+    def test_shutdown_writes_what_is_left(self):
+        recorder = UsageRecorder(batch_size=100)
+        self.record(recorder, 2)
+        recorder.shutdown()
+
+        self.assertEqual(APIUsage.objects.count(), 2)
+
+    def test_failed_batch_is_counted_as_dropped(self):
+        recorder = UsageRecorder(batch_size=2)
+        self.record(recorder, 3)
+        with mock.patch.object(APIUsage.objects, 'bulk_create', side_effect=DatabaseError('locked')), \
+                self.assertLogs('accounts.usage', 'ERROR'):
+            self.assertEqual(recorder.flush(), 0)
+
+        self.assertEqual((recorder.dropped, recorder.flushed, recorder.pending()), (3, 0, 0))
+
+
+class QuotaCounterTests(APIKeyTestCase):
+    def stored(self):
+        return UsageQuota.objects.get(user=self.user).usage_count
+
+    def test_increments_sync_inline_at_max_unsynced(self):
+        counter = QuotaCounter(sync_interval=60, max_unsynced=3)
+        counter.increment(self.user.pk)
+        counter.increment(self.user.pk)
+        self.assertFalse(UsageQuota.objects.filter(user=self.user).exists())
+        self.assertEqual(counter.usage(self.user.pk), 2)
+
+        counter.increment(self.user.pk)
+        self.assertEqual(self.stored(), 3)
+        self.assertEqual(counter.usage(self.user.pk), 3)
+
+    def test_workers_merge_without_losing_increments(self):
+        UsageQuota.objects.create(user=self.user, year=timezone.now().year, month=timezone.now().month, usage_count=10)
+        first, second = QuotaCounter(max_unsynced=50), QuotaCounter(max_unsynced=50)
+        self.assertEqual((first.usage(self.user.pk), second.usage(self.user.pk)), (10, 10))
+
+        for _ in range(4):
+            first.increment(self.user.pk)
+        for _ in range(6):
+            second.increment(self.user.pk)
+        self.assertEqual((first.sync(), second.sync()), (4, 6))
+
+        self.assertEqual(self.stored(), 20)
+
+    def test_overshoot_is_bounded_by_max_unsynced_per_worker(self):
+        limit, max_unsynced = 20, 3
+        workers = [QuotaCounter(sync_interval=60, max_unsynced=max_unsynced) for _ in range(2)]
+        admitted = 0
+        for _ in range(50):
+            for worker in workers:
+                if worker.usage(self.user.pk) < limit:
+                    worker.increment(self.user.pk)
+                    admitted += 1
+        for worker in workers:
+            worker.sync()
+
+        self.assertEqual(self.stored(), admitted)
+        self.assertGreaterEqual(admitted, limit)
+        self.assertLessEqual(admitted, limit + len(workers) * max_unsynced)
+
+    def test_negative_counts_refund(self):
+        counter = QuotaCounter(max_unsynced=50)
+        counter.increment(self.user.pk, count=3)
+        counter.increment(self.user.pk, count=-1)
+        self.assertEqual(counter.usage(self.user.pk), 2)
+        counter.sync()
+
+        counter.increment(self.user.pk, count=-1)
+        counter.sync()
+        self.assertEqual(self.stored(), 1)
+
+
+class RateLimitTests(APIKeyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch('accounts.ratelimit.time', mock.Mock(time=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_spent_then_rejected(self):
+        responses = [self.get() for _ in range(11)]
+
+        self.assertEqual([r.status_code for r in responses], [200] * 10 + [429])
+        self.assertEqual([r['X-RateLimit-Remaining'] for r in responses[:10]], [str(n) for n in range(9, -1, -1)])
+        self.assertEqual(responses[0]['X-RateLimit-Limit'], '10')
+        self.assertEqual(responses[0]['X-RateLimit-Reset'], '1')
+        self.assertEqual(responses[-1]['Retry-After'], '1')
+        self.assertEqual(responses[-1]['X-RateLimit-Reset'], '10')
+
+    def test_tokens_refill_at_the_plan_rate(self):
+        for _ in range(10):
+            self.get()
+        self.now += 2.5
+
+        self.assertEqual([self.get().status_code for _ in range(3)], [200, 200, 429])
+
+    def test_out_of_order_timestamps_do_not_drain_the_bucket(self):
+        self.limiter.consume(self.api_key.pk, 'free')
+        # A request that read the clock earlier but reached the bucket later
+        self.now -= 0.5
+        result = self.limiter.consume(self.api_key.pk, 'free')
+
+        self.assertEqual(result.remaining, 8)
+        self.now += 0.5
+        self.assertEqual(sum(self.limiter.consume(self.api_key.pk, 'free').allowed for _ in range(10)), 8)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class UsageRecordingTests(APIKeyTestCase):
+    def recorded(self, path, **headers):
+        response = self.get(path, **headers)
+        self.recorder.flush()
+        return response, APIUsage.objects.get()
+
+    def test_records_status_latency_size_and_header_source(self):
+        response, usage = self.recorded('/api/test/header/')
+
+        self.assertEqual((usage.endpoint, usage.method, usage.response_status), ('/api/test/header/', 'GET', 200))
+        self.assertEqual(usage.response_size, len(response.content))
+        self.assertGreaterEqual(usage.response_time_ms, 10)
+        self.assertEqual(usage.cache_source, 'cache')
+
+    def test_records_the_payload_source(self):
+        _, usage = self.recorded('/api/test/payload/')
+
+        self.assertEqual(usage.cache_source, 'mse.co.mw')
+
+    def test_not_modified_is_recorded_and_refunded(self):
+        _, usage = self.recorded('/api/test/not-modified/')
+
+        self.assertEqual((usage.response_status, usage.cache_source), (304, 'not-modified'))
+        self.assertEqual(self.quota.usage(self.user.pk), 0)
+
+    def test_view_exception_is_recorded_as_error(self):
+        self.client.raise_request_exception = False
+        with self.assertLogs('django.request', 'ERROR'):
+            _, usage = self.recorded('/api/test/broken/')
+
+        self.assertEqual((usage.response_status, usage.cache_source), (500, 'error'))
+
+    def test_rejected_requests_are_not_recorded(self):
+        self.client.get('/api/test/header/', HTTP_X_API_KEY='mse_unknown')
+        self.recorder.flush()
+
+        self.assertFalse(APIUsage.objects.exists())
+
+
+class UsageRollupTests(APIKeyTestCase):
+    def usage(self, day, endpoint='/api/latest/', response_time_ms=10.0, response_size=100, hour=12):
+        return APIUsage.objects.create(
+            api_key=self.api_key, endpoint=endpoint, method='GET', response_status=200,
+            response_time_ms=response_time_ms, response_size=response_size,
+            timestamp=timezone.make_aware(datetime.combine(day, dt_time(hour))),
+        )
+
+    def rollup(self, *args):
+        call_command('rollup_api_usage', *args, stdout=io.StringIO())
+
+    def test_daily_percentiles(self):
+        day = timezone.localdate() - timedelta(days=1)
+        for ms in range(100, 0, -1):
+            self.usage(day, response_time_ms=float(ms))
+        self.rollup('--no-prune')
+
+        daily = APIUsageDaily.objects.get(date=day)
+        self.assertEqual((daily.request_count, daily.total_response_size), (100, 10000))
+        self.assertEqual((daily.p50_response_time_ms, daily.p95_response_time_ms, daily.p99_response_time_ms),
+                         (50.0, 95.0, 99.0))
+
+    def test_newest_day_is_rebuilt_and_older_days_are_final(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        self.usage(yesterday)
+        self.usage(today, hour=0)
+        self.rollup('--no-prune')
+
+        APIUsage.objects.filter(timestamp__date__lt=today).delete()
+        self.usage(today, hour=1)
+        self.rollup('--no-prune')
+
+        self.assertEqual(APIUsageDaily.objects.get(date=yesterday).request_count, 1)
+        self.assertEqual(APIUsageDaily.objects.get(date=today).request_count, 2)
+
+    def test_raw_rows_past_retention_are_pruned_after_rollup(self):
+        old = timezone.localdate() - timedelta(days=40)
+        self.usage(old)
+        self.usage(timezone.localdate())
+        self.rollup('--retention-days', '30')
+
+        self.assertEqual(APIUsage.objects.count(), 1)
+        self.assertEqual(APIUsageDaily.objects.get(date=old).request_count, 1)
+
+    def test_dashboard_top_endpoints_include_today(self):
+        today = timezone.localdate()
+        self.usage(today - timedelta(days=2), endpoint='/api/historical/TNM/')
+        self.usage(today - timedelta(days=1), endpoint='/api/historical/TNM/')
+        self.rollup('--no-prune')
+        for _ in range(4):
+            self.usage(today, endpoint='/api/latest/')
+        self.usage(today, endpoint='/api/historical/TNM/')
+
+        self.client.force_login(self.user)
+        top_endpoints = self.client.get(reverse('dashboard')).context['top_endpoints']
+
+        self.assertEqual(top_endpoints, [
+            {'endpoint': '/api/latest/', 'requests': 4},
+            {'endpoint': '/api/historical/TNM/', 'requests': 3},
+        ])
@@ -0,0 +1,148 @@
+# Write-behind recording of APIUsage rows and APIKey.last_used
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, Value, When
+from collections import deque
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class UsageRecorder:
+    """
+    Buffers APIUsage records in memory and writes them with bulk_create.
+
+    Requests only append to a queue; a daemon thread flushes the queue every
+    ``flush_interval`` seconds or as soon as ``batch_size`` records are
+    waiting. ``max_pending`` caps how many records a crash can lose: when the
+    queue reaches it, the request that filled it flushes inline.
+
+    API key use is coalesced the same way: ``touch`` keeps only the latest
+    time per key, and each flush writes them with one UPDATE per batch.
+    """
+
+    def __init__(self, flush_interval=0.5, batch_size=100, max_pending=1000, enabled=True):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max(max_pending, batch_size)
+        self.enabled = enabled
+        self._queue = deque()
+        self._last_used = {}  # APIKey pk -> latest use not yet written
+        self._last_used_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(self, usage):
+        """Queue an unsaved APIUsage instance for writing"""
+        if not self.enabled:
+            usage.save()
+            return
+
+        self._ensure_started()
+        self._queue.append(usage)
+        pending = len(self._queue)
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def touch(self, key_id, when):
+        """Note that an API key was used at `when`"""
+        if not self.enabled:
+            self._write_last_used({key_id: when})
+            return
+
+        self._ensure_started()
+        with self._last_used_lock:
+            previous = self._last_used.get(key_id)
+            if previous is None or when > previous:
+                self._last_used[key_id] = when
+
+    def flush(self):
+        """Write everything queued so far; returns the number of usage rows written"""
+        from accounts.models import APIUsage
+
+        written = 0
+        with self._flush_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    APIUsage.objects.bulk_create(batch)
+                    written += len(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.error(f"Failed to write {len(batch)} API usage records: {e}")
+            self.flushed += written
+
+            with self._last_used_lock:
+                last_used, self._last_used = self._last_used, {}
+            if last_used:
+                self._write_last_used(last_used)
+        return written
+
+    def _write_last_used(self, last_used):
+        from accounts.models import APIKey
+
+        key_ids = list(last_used)
+        for start in range(0, len(key_ids), self.batch_size):
+            batch = key_ids[start:start + self.batch_size]
+            try:
+                # Queryset update, so the API key cache isn't invalidated
+                APIKey.objects.filter(pk__in=batch).update(last_used=Case(
+                    *[When(pk=key_id, then=Value(last_used[key_id])) for key_id in batch],
+                    output_field=DateTimeField(),
+                ))
+            except Exception as e:
+                logger.error(f"Failed to update last_used of {len(batch)} API keys: {e}")
+
+    def pending(self):
+        return len(self._queue)
+
+    def shutdown(self):
+        """Stop the flusher thread and write whatever is left"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    daemon=True,
+                    name="MSE-UsageRecorder"
+                )
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in usage recorder loop: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+
+usage_recorder = UsageRecorder(
+    flush_interval=getattr(settings, 'API_USAGE_FLUSH_INTERVAL_MS', 500) / 1000,
+    batch_size=getattr(settings, 'API_USAGE_FLUSH_BATCH_SIZE', 100),
+    max_pending=getattr(settings, 'API_USAGE_MAX_PENDING', 1000),
+    enabled=getattr(settings, 'API_USAGE_WRITE_BEHIND', True),
+)
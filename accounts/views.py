@@ -8,11 +8,12 @@ from django.urls import reverse
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-from django.db.models import Count, Q
-from datetime import datetime, timedelta
+from django.db.models import Count, Q, Sum
+from datetime import datetime, time, timedelta
+from collections import Counter
 import json
 
-from .models import User, APIKey, Subscription, APIUsage, UsageQuota
+from .models import User, APIKey, Subscription, APIUsage, APIUsageDaily, UsageQuota
 from .forms import CustomUserCreationForm, LoginForm
 
 
@@ -96,22 +97,50 @@ def dashboard_view(request):
     monthly_limit = user.subscription.monthly_limit
     usage_percentage = (current_quota.usage_count / monthly_limit) * 100 if monthly_limit > 0 else 0
     
-    # Get recent API requests
+    # Get recent API requests (individual rows, so these stay on APIUsage)
     recent_requests = APIUsage.objects.filter(
         api_key__user=user
     ).order_by('-timestamp')[:10]
     
+    # Most used endpoints over the last 30 days
+    top_endpoints = _top_endpoints(user, timezone.localdate() - timedelta(days=30))
+    
     context = {
         'api_keys': api_keys,
         'api_keys_count': api_keys.count(),
         'usage_this_month': current_quota.usage_count,
         'usage_percentage': min(usage_percentage, 100),
         'recent_requests': recent_requests,
+        'top_endpoints': top_endpoints,
     }
     
     return render(request, 'dashboard/dashboard.html', context)
 
 
+def _top_endpoints(user, since, limit=5):
+    """
+    A user's most requested endpoints since a date. Days the daily rollup has
+    finished come from APIUsageDaily; its newest day may have been partial, so
+    that day and anything after it are counted from the raw APIUsage rows.
+    """
+    newest_rollup = APIUsageDaily.objects.order_by('-date').values_list('date', flat=True).first()
+    raw_since = max(newest_rollup, since) if newest_rollup else since
+    
+    counts = Counter(dict(
+        APIUsageDaily.objects
+        .filter(api_key__user=user, date__gte=since, date__lt=raw_since)
+        .values_list('endpoint')
+        .annotate(requests=Sum('request_count'))
+    ))
+    counts.update(dict(
+        APIUsage.objects
+        .filter(api_key__user=user, timestamp__gte=timezone.make_aware(datetime.combine(raw_since, time.min)))
+        .values_list('endpoint')
+        .annotate(requests=Count('id'))
+    ))
+    return [{'endpoint': endpoint, 'requests': requests} for endpoint, requests in counts.most_common(limit)]
+
+
 @login_required
 @require_http_methods(["POST"])
 def create_api_key(request):
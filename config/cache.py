@@ -0,0 +1,213 @@
+"""
+Two-tier Django cache backend: a bounded in-process LRU (L1) in front of a
+shared cache alias (L2, e.g. the DatabaseCache).
+
+Reads are served from L1 when possible. Keys are grouped into namespaces by
+the text before their first ':' ('historical', 'dataver', 'gen', ...), and
+each namespace has a version stamp in L2. Every set or delete replaces its
+namespace's stamp; each process re-reads the stamps of the namespaces it
+holds at most once per STAMP_CHECK_INTERVAL and drops only the L1 entries
+of namespaces written by another process since. A key that expired from L2
+and is then set again still replaces the stamp, so no process keeps serving
+its old value. L1 entries additionally expire after L1_TIMEOUT seconds.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.cache.TieredCache',
+            'OPTIONS': {'L2': 'shared', 'L1_MAX_ENTRIES': 1000},
+        },
+        'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', ...},
+    }
+
+Locks and other keys that must be read straight from the shared store (e.g.
+the historical single-flight lock) should use the L2 alias directly.
+"""
+from collections import OrderedDict
+import pickle
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+# Replaced by clear(), which drops every namespace; namespace stamps live at STAMP_KEY:<namespace>
+STAMP_KEY = 'tiered-cache:stamp'
+_MISSING = object()
+
+
+def _namespace(key):
+    return key.split(':', 1)[0]
+
+
+def _stamp_key(namespace):
+    return f"{STAMP_KEY}:{namespace}"
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self.stamp_check_interval = float(options.get('STAMP_CHECK_INTERVAL', 1))
+
+        self._l1 = OrderedDict()  # key -> (pickled value, expires at, namespace)
+        self._lock = threading.Lock()
+        self._stamps = {}  # stamp key -> stamp last seen in L2
+        self._stamp_checked = 0.0
+        self._stats = {'l1_hits': 0, 'l1_misses': 0, 'l2_hits': 0, 'l2_misses': 0}
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    # L1 bookkeeping
+
+    def _check_stamps(self):
+        """Drop the L1 entries of namespaces another process has written to since the last check"""
+        now = time.monotonic()
+        if now - self._stamp_checked < self.stamp_check_interval:
+            return
+        with self._lock:
+            stamp_keys = [STAMP_KEY, *{_stamp_key(entry[2]) for entry in self._l1.values()}]
+        stamps = self.l2.get_many(stamp_keys)
+        with self._lock:
+            self._stamp_checked = now
+            changed = {key for key in stamp_keys if stamps.get(key) != self._stamps.get(key)}
+            if STAMP_KEY in changed:
+                self._l1.clear()
+            elif changed:
+                for key in [key for key, entry in self._l1.items() if _stamp_key(entry[2]) in changed]:
+                    del self._l1[key]
+            for key in stamp_keys:
+                self._stamps[key] = stamps.get(key)
+
+    def _bump_stamp(self, stamp_key):
+        stamp = uuid.uuid4().hex
+        self.l2.set(stamp_key, stamp, None)
+        with self._lock:
+            self._stamps[stamp_key] = stamp
+
+    def _watch(self, namespace):
+        """
+        Record a namespace's current stamp the first time this process uses
+        it; called before touching L2 so a concurrent write is never missed
+        """
+        stamp_key = _stamp_key(namespace)
+        if stamp_key not in self._stamps:
+            stamps = self.l2.get_many([STAMP_KEY, stamp_key])
+            with self._lock:
+                self._stamps.setdefault(STAMP_KEY, stamps.get(STAMP_KEY))
+                self._stamps.setdefault(stamp_key, stamps.get(stamp_key))
+
+    def _l1_set(self, key, value, timeout, namespace):
+        if timeout is not None and timeout <= 0:
+            self._l1_delete(key)
+            return
+        ttl = self.l1_timeout if timeout is None else min(self.l1_timeout, timeout)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._l1[key] = (pickled, time.monotonic() + ttl, namespace)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[1] <= time.monotonic():
+                del self._l1[key]
+                return _MISSING
+            self._l1.move_to_end(key)
+            pickled = entry[0]
+        return pickle.loads(pickled)
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def _timeout_seconds(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return timeout
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._check_stamps()
+
+        value = self._l1_get(l1_key)
+        if value is not _MISSING:
+            self._stats['l1_hits'] += 1
+            return value
+        self._stats['l1_misses'] += 1
+
+        self._watch(_namespace(key))
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._stats['l2_misses'] += 1
+            return default
+        self._stats['l2_hits'] += 1
+        self._l1_set(l1_key, value, None, _namespace(key))
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._watch(_namespace(key))
+        self.l2.set(key, value, timeout, version=version)
+        # Even a key that is absent from L2 may still be in another process's L1
+        # after expiring there, so every write replaces the stamp
+        self._bump_stamp(_stamp_key(_namespace(key)))
+        self._l1_set(l1_key, value, self._timeout_seconds(timeout), _namespace(key))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._watch(_namespace(key))
+        if not self.l2.add(key, value, timeout, version=version):
+            return False
+        self._l1_set(l1_key, value, self._timeout_seconds(timeout), _namespace(key))
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        deleted = self.l2.delete(key, version=version)
+        if deleted:
+            self._bump_stamp(_stamp_key(_namespace(key)))
+        return deleted
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+        self._bump_stamp(STAMP_KEY)
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    def stats(self):
+        """Hit counts and ratios per tier since this process started"""
+        stats = dict(self._stats)
+        with self._lock:
+            stats['l1_entries'] = len(self._l1)
+        l1_lookups = stats['l1_hits'] + stats['l1_misses']
+        l2_lookups = stats['l2_hits'] + stats['l2_misses']
+        stats['l1_hit_ratio'] = round(stats['l1_hits'] / l1_lookups, 4) if l1_lookups else 0.0
+        stats['l2_hit_ratio'] = round(stats['l2_hits'] / l2_lookups, 4) if l2_lookups else 0.0
+        stats['overall_hit_ratio'] = round(
+            (stats['l1_hits'] + stats['l2_hits']) / l1_lookups, 4
+        ) if l1_lookups else 0.0
+        return stats
@@ -0,0 +1,96 @@
+"""
+Content-negotiated gzip/brotli compression for /api/ responses.
+
+Only successful, non-streaming responses of at least API_COMPRESSION_MIN_SIZE
+bytes are compressed; images and the paths in API_COMPRESSION_SKIP_PATHS are
+left alone. Brotli is offered when the brotli package is installed.
+
+Pre-rendered payloads (stocks/payload_cache.py) carry a digest of their
+bytes, and their compressed variants are cached under it, so a hot payload
+is compressed once per encoding rather than on every request.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings we can produce, most preferred first
+COMPRESSORS = {
+    **({'br': lambda body: brotli.compress(body, quality=5)} if brotli else {}),
+    'gzip': lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+}
+
+_QUALITY_PATTERN = re.compile(r'q\s*=\s*([0-9.]+)')
+
+
+def negotiate_encoding(accept_encoding):
+    """Best encoding in COMPRESSORS allowed by an Accept-Encoding header, or None"""
+    qualities = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        match = _QUALITY_PATTERN.search(params)
+        try:
+            qualities[name.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+
+    best, best_quality = None, 0.0
+    for encoding in COMPRESSORS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class APICompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if not request.path.startswith('/api/'):
+            return response
+        skip_paths = getattr(settings, 'API_COMPRESSION_SKIP_PATHS', [])
+        if any(request.path.startswith(path) for path in skip_paths):
+            return response
+        if response.streaming or response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith('image/'):
+            return response
+        if len(response.content) < getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = self.compress(response, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # As with Django's GZipMiddleware, the bytes no longer match a strong ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def compress(self, response, encoding):
+        """Compressed body, from the cache when the response is a pre-rendered payload"""
+        digest = getattr(response, 'payload_digest', None)
+        if digest is None:
+            return COMPRESSORS[encoding](response.content)
+
+        key = f"compressed:{encoding}:{digest}"
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = COMPRESSORS[encoding](response.content)
+            cache.set(key, compressed, getattr(settings, 'API_COMPRESSION_CACHE_TIMEOUT', 3600))
+        return compressed
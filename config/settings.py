@@ -80,6 +80,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.compression.APICompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -173,6 +174,16 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
     'DEFAULT_AUTHENTICATION_CLASSES': [],  # Disable DRF authentication
     'DEFAULT_PERMISSION_CLASSES': [],      # Disable DRF permissions
+    # orjson-backed when orjson is installed, DRF's stdlib json otherwise (see config/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # Email Configuration
@@ -186,16 +197,36 @@ DEFAULT_FROM_EMAIL = 'MSE Market Watch <your-email@example.com>'
 
 CSRF_TRUSTED_ORIGINS = ['https://mse-watch.onrender.com','http://35.193.241.192','http://mse-watch.ddns.net','https://mse-api.onrender.com']
 
-# Cache Configuration for Django database cache
+# Cache Configuration: a per-process LRU (L1) in front of the shared database cache (L2),
+# see config/cache.py
 CACHES = {
     'default': {
+        'BACKEND': 'config.cache.TieredCache',
+        'TIMEOUT': 86400,  # 24 hours default
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,  # Seconds an entry read from L2 is trusted without a write stamp change
+            'STAMP_CHECK_INTERVAL': 1,  # Seconds between checks for writes from other processes
+        }
+    },
+    'shared': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'cache_table',
         'TIMEOUT': 86400,  # 24 hours default
         'OPTIONS': {
             'MAX_ENTRIES': 10000,
         }
-    }
+    },
+    # Token buckets for API rate limiting; point this at a shared backend
+    # (e.g. Redis or Memcached) when running several workers
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mse-ratelimit',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        }
+    },
 }
 
 # Custom user model
@@ -204,4 +235,64 @@ AUTH_USER_MODEL = 'accounts.User'
 # Authentication settings
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+# API key middleware
+API_KEY_CACHE_TTL = 60  # Seconds a resolved API key is trusted before re-checking the database
+API_KEY_CACHE_MAX_ENTRIES = 1000
+RATE_LIMIT_CACHE = 'ratelimit'  # Cache alias holding the per-key token buckets
+
+# API usage records are buffered and written in batches (see accounts/usage.py)
+API_USAGE_WRITE_BEHIND = True
+API_USAGE_FLUSH_INTERVAL_MS = 500
+API_USAGE_FLUSH_BATCH_SIZE = 100
+API_USAGE_MAX_PENDING = 1000  # Upper bound on usage records lost if a worker crashes
+API_USAGE_RETENTION_DAYS = 30  # Raw rows older than this are pruned by rollup_api_usage
+
+# Monthly quota counters are kept in memory and merged into UsageQuota (see accounts/quota.py).
+# Each worker admits at most API_QUOTA_MAX_OVERSHOOT requests past a user's limit.
+API_QUOTA_SYNC_INTERVAL = 5  # Seconds
+API_QUOTA_MAX_OVERSHOOT = 50
+API_QUOTA_SHARDS = 16
+API_QUOTA_COUNT_NOT_MODIFIED = False  # Whether 304 revalidations count against the monthly quota
+
+# Serve long historical ranges from HistoricalPrice plus a fetch of only the missing days
+HISTORICAL_INCREMENTAL_SYNC = True
+
+# Concurrent historical backfills (see stocks/services/fetch_service.py)
+HISTORICAL_FETCH_WORKERS = 4
+HISTORICAL_FETCH_RATE = 2.0  # Requests per second to mse.co.mw across all threads
+HISTORICAL_FETCH_PER_HOST = 2  # Concurrent connections per host
+HISTORICAL_FETCH_MAX_RETRIES = 3
+HISTORICAL_FETCH_BACKOFF = 1.0  # Seconds; doubled per retry, with full jitter
+HISTORICAL_FETCH_BACKOFF_MAX = 30.0
+
+# Only one fetch per historical cache key runs at a time (see stocks/services/singleflight.py).
+# The cross-process lock lives in HISTORICAL_SINGLE_FLIGHT_CACHE, which must be shared by all workers.
+HISTORICAL_SINGLE_FLIGHT_CROSS_PROCESS = True
+HISTORICAL_SINGLE_FLIGHT_CACHE = 'shared'  # The L2 alias, so lock reads bypass the per-process L1
+HISTORICAL_SINGLE_FLIGHT_LOCK_TIMEOUT = 60  # Seconds; longer than one MSE fetch
+HISTORICAL_SINGLE_FLIGHT_WAIT_TIMEOUT = 45  # Seconds a waiting request polls before fetching itself
+
+# Stale-while-revalidate for /api/historical/: a range is fresh for 'soft' seconds, then
+# served stale (with a background refresh) until 'hard' seconds old
+HISTORICAL_CACHE_TTLS = {
+    '1month': {'soft': 6 * 3600, 'hard': 2 * 86400},
+    '3months': {'soft': 6 * 3600, 'hard': 2 * 86400},
+    '6months': {'soft': 86400, 'hard': 7 * 86400},
+    '1year': {'soft': 86400, 'hard': 7 * 86400},
+    '2years': {'soft': 86400, 'hard': 7 * 86400},
+    '5years': {'soft': 86400, 'hard': 7 * 86400},
+}
+HISTORICAL_REVALIDATE_WORKERS = 2
+
+# Cache namespaces (see stocks/cache_keys.py) expired by the daily maintenance task
+CACHE_MAINTENANCE_NAMESPACES = ['intraday']
+
+# ETag/Last-Modified stamps (see stocks/data_versions.py) are re-read from the database
+# at most this often; writers through the scraper and historical service update them at once
+DATA_VERSION_TTL = 60  # Seconds
+
+# gzip/brotli for /api/ responses (see config/compression.py); brotli needs the brotli package
+API_COMPRESSION_MIN_SIZE = 1024  # Bytes; smaller responses are sent as-is
+API_COMPRESSION_SKIP_PATHS = ['/api/stock-icon/']  # Already-compressed images
+API_COMPRESSION_CACHE_TIMEOUT = 3600  # Seconds compressed pre-rendered payloads are kept
@@ -1,19 +1,197 @@
 import requests
 import re
-import pandas as pd
 import os
+import json
+import hashlib
 from datetime import datetime
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 import traceback
 
-def extract_mse_data_html(force_scrape=False):
+MSE_URL = "https://mse.co.mw/"
+MAX_EQUITIES = 16  # Limit to first 16 stocks
+
+# HTTP validators and ticker fingerprint of the last page we parsed
+PAGE_STATE_FILE = os.path.join('data', 'mse_page_state.json')
+
+# Raw markup of the ticker items and the market status, hashed before parsing
+TICKER_BLOCK_PATTERN = re.compile(
+    rb'<div[^>]*ticker__item.*?</div>|Market Status:.*?</span>\s*<span[^>]*>.*?</span>',
+    re.S
+)
+
+
+def _has_class(name):
+    """XPath predicate matching elements with the given CSS class"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Targeted XPath selectors for the parts of the homepage we read
+UPDATE_TIME_XPATH = f"//div[{_has_class('time')}]//span[contains(., '/')]"
+MARKET_STATUS_XPATH = "//span[contains(., 'Market Status:')]/following-sibling::span[1]"
+MARKET_STATUS_FALLBACK_XPATH = f"//div[{_has_class('time')}]/div/small/span"
+TICKER_ITEM_XPATH = f"//div[{_has_class('ticker__item')}]"
+SYMBOL_XPATH = ".//span[not(preceding-sibling::*)]"
+PRICE_XPATH = f".//span[{_has_class('pricedata')}]"
+CHANGE_XPATH = f".//span[{_has_class('changedata')}]"
+CHANGE_PATTERN = re.compile(r"\(([-+]?\d+(?:\.\d+)?)\)")
+
+
+def _first_text(root, xpath):
+    elements = root.xpath(xpath)
+    return elements[0].text_content().strip() if elements else None
+
+
+def parse_mse_html(content, scraped_at=None):
+    """Parse the MSE homepage into a list of tick records.
+    
+    Args:
+        content (bytes or str): Homepage HTML
+        scraped_at (datetime): Time stamped on every record (defaults to now)
+    
+    Returns:
+        list: One dict per stock with Symbol, Price, Change, Direction, Date,
+        Time, Market_Status and Market_Update_Time keys
+    """
+    root = lxml_html.fromstring(content)
+    
+    # Get market status and update time
+    update_time = _first_text(root, UPDATE_TIME_XPATH) or "Unknown"
+    print(f"Market data updated on: {update_time}")
+    
+    market_status = _first_text(root, MARKET_STATUS_XPATH)
+    if not market_status:
+        fallback = _first_text(root, MARKET_STATUS_FALLBACK_XPATH)
+        market_status = fallback.replace('Market Status: ', '').strip() if fallback else "Unknown"
+    print(f"Market Status: {market_status}")
+    
+    # Find ticker items containing stocks
+    ticker_items = root.xpath(TICKER_ITEM_XPATH)
+    print(f"Found {len(ticker_items)} ticker items")
+    
+    scraped_at = scraped_at or datetime.now()
+    scrape_date = scraped_at.strftime('%Y-%m-%d')
+    scrape_time = scraped_at.strftime('%H:%M:%S')
+    
+    records = []
+    for i, item in enumerate(ticker_items):
+        # Stop if we've collected the maximum number of equities
+        if len(records) >= MAX_EQUITIES:
+            break
+            
+        try:
+            symbol = _first_text(item, SYMBOL_XPATH)
+            if not symbol:
+                continue
+            
+            price_spans = item.xpath(PRICE_XPATH)
+            change_spans = item.xpath(CHANGE_XPATH)
+            if not price_spans or not change_spans:
+                print(f"Item {i+1} missing price or change span, skipping")
+                continue
+            price_span = price_spans[0]
+            
+            print(f"Processing stock: {symbol}")
+            
+            # Extract price (remove commas)
+            price_text = price_span.text_content().strip().replace(',', '')
+            try:
+                price = float(price_text) if price_text else None
+            except ValueError:
+                print(f"Warning: Could not parse price for {symbol}: '{price_text}'")
+                price = None
+            if price is None:
+                continue
+            
+            # Extract change value
+            change_text = change_spans[0].text_content().strip()
+            change_match = CHANGE_PATTERN.search(change_text)
+            change = float(change_match.group(1)) if change_match else 0.0
+            
+            # Get direction
+            price_classes = (price_span.get('class') or '').split()
+            if "changeup" in price_classes:
+                direction = "up"
+            elif "changedown" in price_classes:
+                direction = "down"
+            else:
+                direction = "no change"
+            
+            records.append({
+                'Symbol': symbol,
+                'Price': price,
+                'Change': change,
+                'Direction': direction,
+                'Date': scrape_date,
+                'Time': scrape_time,
+                'Market_Status': market_status,
+                'Market_Update_Time': update_time
+            })
+            
+        except Exception as e:
+            print(f"Error processing item {i+1}: {e}")
+    
+    return records
+
+
+def ticker_block_hash(content):
+    """SHA-1 of the ticker items and market status markup, or None if none were found"""
+    blocks = TICKER_BLOCK_PATTERN.findall(content)
+    if not blocks:
+        return None
+    return hashlib.sha1(b'\n'.join(blocks)).hexdigest()
+
+
+def load_page_state(today=None):
+    """
+    Return the saved validators for the homepage, or {} if there are none.
+    
+    State is only reused on the day it was recorded so the first scrape of
+    every day always parses the page and stores that day's opening ticks.
+    """
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    try:
+        with open(PAGE_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if state.get('date') == today else {}
+
+
+def save_page_state(state):
+    try:
+        os.makedirs(os.path.dirname(PAGE_STATE_FILE), exist_ok=True)
+        with open(PAGE_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    except OSError as e:
+        print(f"Warning: Could not save page state: {e}")
+
+
+def extract_mse_data_html(force_scrape=False, conditional=True, with_page_state=False):
     """Extract stock data from the Malawi Stock Exchange website using HTML download.
     
+    The page is parsed in memory with lxml; nothing is written to disk.
+    With conditional=True the request carries the ETag/Last-Modified of the
+    last parsed page, and a 304 or an unchanged ticker block skips the parse.
+    The validators of a parsed page are not stored here: the caller passes
+    them to save_page_state once the records are saved, so a failed save
+    doesn't make the next scrape skip ticks that never reached the database.
+    
     Args:
         force_scrape (bool): If True, scrape regardless of market status or time
+        conditional (bool): If False, always download and parse the full page
+        with_page_state (bool): If True, return (records, page_state), where
+            page_state is the dict to save after the records, or None
+    
+    Returns:
+        list: Tick records (see parse_mse_html), [] if the page is unchanged
+        since the last scrape, or None if nothing was extracted
     """
-    url = "https://mse.co.mw/"
-    html_file = "temp_mse.html"
+    records, page_state = _extract_mse_data_html(force_scrape, conditional)
+    return (records, page_state) if with_page_state else records
+
+
+def _extract_mse_data_html(force_scrape, conditional):
+    url = MSE_URL
     
     # Check if we should scrape based on current time
     current_time = datetime.now()
@@ -28,7 +206,7 @@ def extract_mse_data_html(force_scrape=False):
     # Skip scraping if outside market hours (before 09:00 or after 17:00) unless explicitly forced
     if (current_time_value < market_start or current_time_value > market_end) and not force_scrape:
         print(f"Market is outside operating hours (current time: {current_time.strftime('%H:%M')}). Skipping scrape.")
-        return None
+        return None, None
     
     try:
         print(f"Downloading HTML from {url}...")
@@ -36,156 +214,55 @@ def extract_mse_data_html(force_scrape=False):
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        today = current_time.strftime('%Y-%m-%d')
+        state = load_page_state(today) if conditional else {}
+        if state.get('etag'):
+            headers["If-None-Match"] = state['etag']
+        if state.get('last_modified'):
+            headers["If-Modified-Since"] = state['last_modified']
+        
         response = requests.get(url, headers=headers, timeout=10)
+        if response.status_code == 304:
+            print("Page not modified since last scrape, skipping parse")
+            return [], None
         response.raise_for_status()  # Raise an exception for bad responses
         
-        # Save HTML to a temporary file
-        with open(html_file, "w", encoding="utf-8") as f:
-            f.write(response.text)
-        print(f"HTML saved to {html_file}")
+        content_hash = ticker_block_hash(response.content)
+        if content_hash and content_hash == state.get('ticker_hash'):
+            print("Ticker block unchanged since last scrape, skipping parse")
+            return [], None
         
-        # Parse HTML with BeautifulSoup
         print("Extracting data from HTML...")
-        with open(html_file, "r", encoding="utf-8") as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
-        
-        # Get market status and update time
-        update_time = "Unknown"
-        market_status = "Unknown"
-        
-        # Try to find the update time
-        update_time_elem = soup.select_one("div.time span:-soup-contains('/')")
-        if update_time_elem:
-            update_time = update_time_elem.text.strip()
-            print(f"Market data updated on: {update_time}")
-        
-        # Try to find market status
-        try:
-            market_status_elem = soup.select_one("span:-soup-contains('Market Status:') + span")
-            if market_status_elem:
-                market_status = market_status_elem.text.strip()
-            else:
-                market_status_elem = soup.select_one("div.time div small span")
-                if market_status_elem:
-                    market_status = market_status_elem.text.replace('Market Status: ', '').strip()
-        except:
-            pass
-            
-        print(f"Market Status: {market_status}")
-        
-        # Find ticker items containing stocks
-        ticker_items = soup.select("div.ticker__item")
-        print(f"Found {len(ticker_items)} ticker items")
-        
-        # Extract stock data
-        data = []
-        equity_count = 0
-        max_equities = 16  # Limit to first 16 stocks
-        
-        for i, item in enumerate(ticker_items):
-            # Stop if we've collected the maximum number of equities
-            if equity_count >= max_equities:
-                break
-                
-            try:
-                # Get symbol (first span)
-                symbol_span = item.select_one("span:first-child")
-                if not symbol_span:
-                    continue
-                
-                symbol = symbol_span.text.strip()
-                if not symbol:
-                    continue
-                
-                # Get price span and change span
-                price_span = item.select_one("span.pricedata")
-                change_span = item.select_one("span.changedata")
-                
-                if not price_span or not change_span:
-                    print(f"Item {i+1} missing price or change span, skipping")
-                    continue
-                
-                print(f"Processing stock: {symbol}")
-                
-                # Extract price (remove commas)
-                price_text = price_span.text.strip().replace(',', '')
-                try:
-                    price = float(price_text) if price_text else None
-                except ValueError:
-                    print(f"Warning: Could not parse price for {symbol}: '{price_text}'")
-                    price = None
-                
-                # Extract change value
-                change_text = change_span.text.strip()
-                change_match = re.search(r"\(([-+]?\d+(?:\.\d+)?)\)", change_text)
-                try:
-                    change = float(change_match.group(1)) if change_match else 0.0
-                except (ValueError, AttributeError):
-                    print(f"Warning: Could not parse change for {symbol}: '{change_text}'")
-                    change = 0.0
-                
-                # Get direction
-                if "changeup" in price_span.get("class", []):
-                    direction = "up"
-                elif "changedown" in price_span.get("class", []):
-                    direction = "down"
-                else:
-                    direction = "no change"
-                
-                # Add to data
-                data.append({
-                    'Symbol': symbol,
-                    'Price': price,
-                    'Change': change,
-                    'Direction': direction
-                })
-                
-                print(f"Added {symbol} with price={price}, change={change}, direction={direction}")
-                
-                # Increment the equity counter
-                equity_count += 1
-                
-            except Exception as e:
-                print(f"Error processing item {i+1}: {e}")
+        records = parse_mse_html(response.content)
         
-        # Create DataFrame
-        if data:
-            df = pd.DataFrame(data)
-            
-            # Add metadata
-            current_time = datetime.now()
-            df['Date'] = current_time.strftime('%Y-%m-%d')
-            df['Time'] = current_time.strftime('%H:%M:%S')
-            df['Market_Status'] = market_status
-            df['Market_Update_Time'] = update_time
-            
-            # Filter out any rows with NaN values in Symbol or Price
-            df = df.dropna(subset=['Symbol', 'Price'])
-            
-            print(f"Successfully extracted data for {len(df)} stocks")
-            return df
+        if records:
+            print(f"Successfully extracted data for {len(records)} stocks")
+            return records, {
+                'date': today,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'ticker_hash': content_hash,
+            }
         else:
             print("No stock data found")
-            return None
+            return None, None
             
     except Exception as e:
         print(f"Error extracting data: {e}")
         traceback.print_exc()
-        return None
-        
-    finally:
-        # Delete the temporary HTML file
-        if os.path.exists(html_file):
-            os.remove(html_file)
-            print(f"Deleted temporary file {html_file}")
+        return None, None
 
-def save_data(df):
+def save_data(records):
     """
     Save the extracted data to CSV
     """
-    if df is None:
+    if not records:
         return
     
+    # pandas is only needed for the CSV export, so it stays off the scrape path
+    import pandas as pd
+    df = pd.DataFrame(records)
+    
     # Create a directory for the data if it doesn't exist
     os.makedirs('data', exist_ok=True)
     
@@ -208,13 +285,26 @@ def save_data(df):
     
     print(f"Data appended to {consolidated_file}")
 
-def save_to_database(df):
+def save_to_database(records, only_changed=True):
     """
     Save the extracted data to the database
+    
+    All ticks of a scrape share one date and time, so they are parsed once and
+    written with a single bulk_create (updating any tick already stored for
+    the same symbol, date and time), together with the LatestPrice snapshot,
+    in one transaction.
+    
+    With only_changed=True a tick is skipped when the symbol's last stored
+    tick from the same day has the same price, change and market status.
+    
+    Returns:
+        dict: {'saved': rows written, 'unchanged': ticks skipped,
+        'parse_ms', 'write_ms', 'total_ms', 'error': message if the write failed, else None}
     """
     import os
     import django
     import sys
+    import time
 
     # Only set up Django if it's not already set up
     # This is needed when running the scraper directly
@@ -224,46 +314,88 @@ def save_to_database(df):
         django.setup()
 
     # Import the model after Django setup
-    from stocks.models import StockPrice
+    from stocks.models import StockPrice, LatestPrice
+    from stocks.cache_keys import invalidate
+    from stocks import data_versions
+    from django.db import transaction
     from datetime import datetime
 
-    if df is None:
+    stats = {'saved': 0, 'unchanged': 0, 'parse_ms': 0.0, 'write_ms': 0.0, 'total_ms': 0.0, 'error': None}
+    if not records:
         print("No data to save to database")
-        return 0
+        return stats
 
-    count = 0
-    for _, row in df.iterrows():
-        try:
-            # Parse date and time from strings
-            date = datetime.strptime(row['Date'], '%Y-%m-%d').date()
-            time_obj = datetime.strptime(row['Time'], '%H:%M:%S').time()
-            
-            # Create or update stock price entry
-            StockPrice.objects.update_or_create(
-                symbol=row['Symbol'],
-                date=date,
-                time=time_obj,
-                defaults={
-                    'price': row['Price'],
-                    'change': row['Change'],
-                    'direction': row['Direction'],
-                    'market_status': row['Market_Status'],
-                    'market_update_time': row['Market_Update_Time']
+    started = time.perf_counter()
+    rows = records
+    
+    # Parse date and time once per scrape
+    scrape_date = datetime.strptime(rows[0]['Date'], '%Y-%m-%d').date()
+    scrape_time = datetime.strptime(rows[0]['Time'], '%H:%M:%S').time()
+    
+    ticks = [
+        StockPrice(
+            symbol=row['Symbol'],
+            price=row['Price'],
+            change=row['Change'],
+            direction=row['Direction'],
+            date=scrape_date,
+            time=scrape_time,
+            market_status=row['Market_Status'],
+            market_update_time=row['Market_Update_Time']
+        )
+        for row in rows
+    ]
+    parsed = time.perf_counter()
+
+    try:
+        with transaction.atomic():
+            if only_changed:
+                last_stored = {
+                    symbol: (price, change, market_status)
+                    for symbol, price, change, market_status in LatestPrice.objects.filter(
+                        symbol__in=[tick.symbol for tick in ticks], date=scrape_date
+                    ).values_list('symbol', 'price', 'change', 'market_status')
                 }
+                changed = [
+                    tick for tick in ticks
+                    if last_stored.get(tick.symbol) != (tick.price, tick.change, tick.market_status)
+                ]
+                stats['unchanged'] = len(ticks) - len(changed)
+                ticks = changed
+            StockPrice.objects.bulk_create(
+                ticks,
+                update_conflicts=True,
+                unique_fields=['symbol', 'date', 'time'],
+                update_fields=['price', 'change', 'direction', 'market_status', 'market_update_time'],
             )
-            count += 1
-        except Exception as e:
-            print(f"Error saving {row['Symbol']} to database: {e}")
-    
-    print(f"Saved {count} stock prices to database")
-    return count
+            LatestPrice.update_from_ticks(ticks)
+            # Only the symbols that moved lose their cached intraday data
+            for symbol in {tick.symbol for tick in ticks}:
+                transaction.on_commit(lambda symbol=symbol: invalidate('intraday', symbol))
+            if ticks:
+                transaction.on_commit(lambda: data_versions.touch('ticks'))
+        stats['saved'] = len(ticks)
+    except Exception as e:
+        stats['error'] = str(e)
+        print(f"Error saving batch of {len(ticks)} stock prices to database: {e}")
+    written = time.perf_counter()
+
+    stats['parse_ms'] = round((parsed - started) * 1000, 2)
+    stats['write_ms'] = round((written - parsed) * 1000, 2)
+    stats['total_ms'] = round((written - started) * 1000, 2)
+    print(f"Saved {stats['saved']} stock prices to database ({stats['unchanged']} unchanged) in {stats['total_ms']} ms "
+          f"(parse {stats['parse_ms']} ms, write {stats['write_ms']} ms)")
+    return stats
 
 if __name__ == "__main__":
-    df = extract_mse_data_html()
-    if df is not None:
-        print(f"Successfully extracted data for {len(df)} stocks:")
-        print(df)
-        save_data(df)  # Save to CSV
-        save_to_database(df)  # Save to database
+    records, page_state = extract_mse_data_html(with_page_state=True)
+    if records is not None:
+        print(f"Successfully extracted data for {len(records)} stocks:")
+        for record in records:
+            print(record)
+        save_data(records)  # Save to CSV
+        stats = save_to_database(records)  # Save to database
+        if stats['error'] is None and page_state:
+            save_page_state(page_state)
     else:
         print("Failed to extract data.")
\ No newline at end of file
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import  StockPrice, Company, HistoricalPrice
+from .models import  StockPrice, LatestPrice, Company, HistoricalPrice
 
 #admin.site.register(Stock)
 admin.site.register(StockPrice)
+admin.site.register(LatestPrice)
 #admin.site.register(StockPriceHistory)
 admin.site.register(Company)
 admin.site.register(HistoricalPrice)
@@ -15,6 +15,8 @@ class StocksConfig(AppConfig):
         Start the background data collector when Django starts.
         This replaces the old manual cache refresh approach with automatic collection.
         """
+        from . import signals
+        
         # Only start in the main process (avoid duplicates during development)
         # Skip if we're in a migration, test, or other management command
         if (os.environ.get('RUN_MAIN') == 'true' or 
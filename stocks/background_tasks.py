@@ -118,21 +118,16 @@ class BackgroundDataCollector:
             priority_symbols = ['AIRTEL', 'TNM', 'NBM', 'STANDARD', 'NICO', 'FDHB']
             priority_ranges = ['1month', '3months', '6months', '1year']
             
-            success_count = 0
-            total_count = len(priority_symbols) * len(priority_ranges)
+            # Fetch concurrently through the shared rate-limited session
+            from stocks.services.fetch_service import historical_fetcher
+            results = historical_fetcher.fetch_many(priority_symbols, priority_ranges, save=True)
             
-            for symbol in priority_symbols:
-                for time_range in priority_ranges:
-                    try:
-                        # Try to collect fresh data
-                        if self._collect_historical_for_symbol(symbol, time_range):
-                            success_count += 1
-                        
-                        time.sleep(2)  # Small delay between requests
-                        
-                    except Exception as e:
-                        logger.error(f"Error collecting {symbol} {time_range}: {e}")
-                        self.collection_stats['historical_failed'] += 1
+            success_count = sum(1 for result in results if result.data and not result.error)
+            total_count = len(results)
+            for result in results:
+                if result.error:
+                    logger.error(f"Error collecting {result.symbol} {result.time_range}: {result.error}")
+                    self.collection_stats['historical_failed'] += 1
             
             success_rate = (success_count / total_count) * 100 if total_count > 0 else 0
             
@@ -154,10 +149,15 @@ class BackgroundDataCollector:
         try:
             logger.info("[MAINTENANCE] Running daily maintenance")
             
-            # Clear old cache entries
-            from django.core.cache import cache
-            cache.clear()
-            logger.info("Cache cleared")
+            # Expire yesterday's namespaces instead of flushing the whole cache;
+            # historical ranges keep their stale copies for stale-while-revalidate
+            from stocks.cache_keys import invalidate
+            for namespace in getattr(settings, 'CACHE_MAINTENANCE_NAMESPACES', ['intraday']):
+                invalidate(namespace)
+            logger.info("Cache namespaces expired")
+            
+            # Roll up API usage into daily summaries and prune old raw rows
+            management.call_command('rollup_api_usage')
             
             # Clean up old log files (keep last 7 days)
             self._cleanup_old_logs()
@@ -0,0 +1,50 @@
+"""
+Namespaced, versioned cache keys.
+
+Every key belongs to a namespace (see NAMESPACES) and a symbol, and
+embeds the current generation of both. Bumping a generation makes all keys
+built under the old one unreachable, so one symbol (or one whole namespace)
+can be invalidated without cache.clear(); the orphaned entries simply expire.
+"""
+import time
+
+from django.core.cache import cache
+
+NAMESPACES = ('historical', 'historical-stale', 'intraday')
+
+
+def _generation_key(namespace, symbol=None):
+    return f"gen:{namespace}:{symbol}" if symbol else f"gen:{namespace}"
+
+
+def _new_generation():
+    # Unique across processes without a read-modify-write
+    return time.time_ns()
+
+
+def versioned_key(namespace, symbol, *parts):
+    """
+    Key for `parts` under a symbol's namespace, e.g.
+    versioned_key('historical', 'TNM', '1month', '2025-06-24')
+    -> 'historical:TNM:<namespace gen>.<symbol gen>:1month:2025-06-24'
+    """
+    generation_keys = [_generation_key(namespace), _generation_key(namespace, symbol)]
+    generations = cache.get_many(generation_keys)
+    for key in generation_keys:
+        if key not in generations:
+            # First use, or the counter was culled: start a generation no old key can share
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    namespace_gen, symbol_gen = (generations[key] for key in generation_keys)
+    return ':'.join([namespace, symbol, f"{namespace_gen}.{symbol_gen}", *map(str, parts)])
+
+
+def invalidate(namespace, symbol=None):
+    """Expire every key of one symbol in a namespace, or of the whole namespace"""
+    cache.set(_generation_key(namespace, symbol), _new_generation(), None)
+
+
+def invalidate_symbol(symbol):
+    """Expire all of a symbol's cached data"""
+    for namespace in NAMESPACES:
+        invalidate(namespace, symbol)
@@ -0,0 +1,54 @@
+"""
+Cheap data-version stamps for conditional GET.
+
+Each stamp is the time its data last changed: the newest scrape for the
+tick-based endpoints, the newest HistoricalPrice.last_updated per symbol
+and Company.last_updated. Writers call touch() so stamps move immediately;
+stamps are otherwise read from the database at most once per
+DATA_VERSION_TTL seconds, which also catches writes made elsewhere (admin,
+shell).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+
+def _key(name):
+    return f"dataver:{name}"
+
+
+def _stamp(name, compute):
+    stamp = cache.get(_key(name))
+    if stamp is None:
+        stamp = compute()
+        if stamp is not None:
+            cache.set(_key(name), stamp, getattr(settings, 'DATA_VERSION_TTL', 60))
+    return stamp
+
+
+def touch(name, when=None):
+    """Record that the data behind a stamp changed"""
+    cache.set(_key(name), when or timezone.now(), getattr(settings, 'DATA_VERSION_TTL', 60))
+
+
+def ticks_version():
+    """When the newest scrape was stored"""
+    from stocks.models import LatestPrice
+    return _stamp('ticks', lambda: LatestPrice.objects.aggregate(stamp=Max('updated_at'))['stamp'])
+
+
+def historical_version(symbol):
+    """When a symbol's historical prices last changed"""
+    from stocks.models import HistoricalPrice
+    return _stamp(f"historical:{symbol}", lambda: (
+        HistoricalPrice.objects.filter(symbol=symbol).aggregate(stamp=Max('last_updated'))['stamp']
+    ))
+
+
+def company_version(symbol):
+    """When a company's profile last changed, None if it does not exist"""
+    from stocks.models import Company
+    return _stamp(f"company:{symbol}", lambda: (
+        Company.objects.filter(symbol=symbol).values_list('last_updated', flat=True).first()
+    ))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from stocks.management.scratch_db import scratch_database
+from stocks.services.historical_service import MSEHistoricalService
+from datetime import date, timedelta
+import logging
+import random
+import time as timer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark MSEHistoricalService.save_to_database (row-by-row vs bulk upsert) on a synthetic 5years series'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--symbols',
+            type=int,
+            default=16,
+            help='Number of synthetic symbols to save (default: 16)'
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=1200,
+            help='Data points per symbol (default: 1200, a 5years fetch)'
+        )
+    
+    def handle(self, *args, **options):
+        # The synthetic symbols have no Company rows; keep the per-save warnings out of the report
+        logging.getLogger('stocks.services.historical_service').setLevel(logging.ERROR)
+        
+        service = MSEHistoricalService()
+        series = {
+            f"BENCH{i:02d}": self.make_series(options['points'])
+            for i in range(options['symbols'])
+        }
+        total_rows = sum(len(data['stock_prices']) for data in series.values())
+        self.stdout.write(f"Saving {len(series)} symbols x {options['points']} points ({total_rows:,} rows)\n")
+        
+        # Runs in a throwaway database, so the live one is never locked or written
+        with scratch_database() as database:
+            self.stdout.write(f"Benchmarking in scratch database {database}")
+            for label, bulk in (('row-by-row', False), ('bulk upsert', True)):
+                # Each mode runs an insert pass and an update pass, then rolls back
+                with transaction.atomic():
+                    for pass_name in ('insert', 'update'):
+                        started = timer.perf_counter()
+                        for symbol, data in series.items():
+                            service.save_to_database(symbol, data, bulk=bulk)
+                        elapsed = timer.perf_counter() - started
+                        self.stdout.write(
+                            f"  {label:<12} {pass_name:<7} {elapsed:8.2f}s  {total_rows / elapsed:10,.0f} rows/sec"
+                        )
+                    transaction.set_rollback(True)
+        
+        self.stdout.write(self.style.SUCCESS("\nScratch database destroyed"))
+    
+    def make_series(self, points):
+        """A 5years-shaped chart series: one point per weekday, oldest first"""
+        day = date.today()
+        dates = []
+        while len(dates) < points:
+            if day.weekday() < 5:
+                dates.append(day)
+            day -= timedelta(days=1)
+        
+        price = random.uniform(10, 5000)
+        stock_prices = []
+        for point_date in reversed(dates):
+            price = max(1.0, price * random.uniform(0.98, 1.02))
+            stock_prices.append({
+                'date': point_date.isoformat(),
+                'price': round(price, 2),
+                'close': round(price, 2),
+                'open': None,
+                'high': None,
+                'low': None,
+                'volume': None,
+                'turnover': None
+            })
+        return {'stock_prices': stock_prices}
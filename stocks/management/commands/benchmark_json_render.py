@@ -0,0 +1,121 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from config.renderers import FastJSONRenderer, orjson
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import random
+import time as timer
+import tracemalloc
+
+
+class Command(BaseCommand):
+    help = 'Benchmark API JSON rendering (DRF stdlib JSONRenderer vs orjson FastJSONRenderer) on synthetic payloads'
+
+    SYMBOLS = [
+        'AIRTEL', 'BHL', 'FDHB', 'FMBCH', 'ICON', 'ILLOVO',
+        'MPICO', 'NBM', 'NBS', 'NICO', 'NITL', 'OMU',
+        'PCL', 'STANDARD', 'SUNBIRD', 'TNM'
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Renders per payload and renderer (default: 50)'
+        )
+        parser.add_argument(
+            '--ticks',
+            type=int,
+            default=5000,
+            help='Rows in the prices/ listing payload (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed; FastJSONRenderer would fall back to the stdlib renderer')
+
+        iterations = options['iterations']
+        renderers = (('DRF JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer()))
+        payloads = (
+            ('historical 5years (1200 points)', self.historical_payload(1200)),
+            (f"prices/ listing ({options['ticks']} ticks)", self.prices_payload(options['ticks'])),
+            ('raw rows (date/time/Decimal/datetime)', self.raw_rows_payload(1200)),
+        )
+
+        for label, payload in payloads:
+            self.stdout.write(f"\n{label}, {iterations} iterations")
+            results = {}
+            for name, renderer in renderers:
+                results[name] = self.measure(renderer, payload, iterations)
+                avg_ms, peak_kb, size = results[name]
+                self.stdout.write(f"  {name:<18} {avg_ms:8.2f} ms/render  py-heap peak {peak_kb:9.1f} KB  {size / 1024:8.1f} KB out")
+
+            stdlib, fast = results['DRF JSONRenderer'], results['FastJSONRenderer']
+            if JSONRenderer().render(payload) != FastJSONRenderer().render(payload):
+                raise CommandError(f"Renderers disagree on the {label} payload")
+            self.stdout.write(self.style.SUCCESS(
+                f"  orjson is {stdlib[0] / fast[0]:.1f}x faster with {stdlib[1] / fast[1]:.1f}x lower peak memory, same output"
+            ))
+
+    def measure(self, renderer, payload, iterations):
+        """Return (avg ms per render, peak KB of one render, bytes rendered)"""
+        renderer.render(payload)  # warm up
+
+        started = timer.perf_counter()
+        for _ in range(iterations):
+            rendered = renderer.render(payload)
+        avg_ms = (timer.perf_counter() - started) * 1000 / iterations
+
+        tracemalloc.start()
+        renderer.render(payload)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return avg_ms, peak / 1024, len(rendered)
+
+    def historical_payload(self, points):
+        """Shaped like get_cached_historical_data's result"""
+        price = 20.0
+        start = date.today() - timedelta(days=points)
+        stock_prices = []
+        for offset in range(points):
+            price = round(max(1.0, price * random.uniform(0.98, 1.02)), 2)
+            stock_prices.append({
+                'date': (start + timedelta(days=offset)).isoformat(),
+                'open': price, 'high': round(price * 1.01, 2), 'low': round(price * 0.99, 2), 'close': price,
+                'volume': random.randint(0, 500000),
+                'turnover': round(price * random.randint(0, 500000), 2),
+            })
+        return {
+            'company': {'symbol': 'TNM', 'name': 'Telekom Networks Malawi plc', 'current_price': price},
+            'time_range': '5years',
+            'stock_prices': stock_prices,
+            'retrieved_at': datetime.now().isoformat(),
+            'data_points': points,
+        }
+
+    def prices_payload(self, ticks):
+        """Shaped like StockPriceSerializer output for the prices/ endpoint"""
+        today = date.today()
+        return [{
+            'symbol': random.choice(self.SYMBOLS),
+            'price': round(random.uniform(1, 5000), 2),
+            'change': round(random.uniform(-5, 5), 2),
+            'percent_change': round(random.uniform(-2, 2), 4),
+            'direction': random.choice(['up', 'down', 'no change']),
+            'date': (today - timedelta(days=i // 40)).isoformat(),
+            'time': time(9 + i % 8, i % 60).isoformat(),
+            'market_status': 'Open',
+            'market_update_time': '24/06/2025 14:45:02',
+        } for i in range(ticks)]
+
+    def raw_rows_payload(self, points):
+        """Model values that reach the renderer unconverted, as from values()"""
+        now = datetime.now().astimezone()
+        return [{
+            'date': date.today() - timedelta(days=i),
+            'time': time(14, 30),
+            'close': Decimal(f"{random.uniform(1, 5000):.2f}"),
+            'last_updated': now - timedelta(days=i),
+        } for i in range(points)]
@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from pathlib import Path
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import time as timer
+import tracemalloc
+
+
+DEFAULT_FIXTURE = Path(__file__).resolve().parent.parent.parent / 'fixtures' / 'mse_homepage.html'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the scraper HTML parse (legacy BeautifulSoup/temp file/pandas vs in-memory lxml) on saved pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--html',
+            nargs='+',
+            default=[str(DEFAULT_FIXTURE)],
+            help='Saved MSE homepage HTML files to parse (default: stocks/fixtures/mse_homepage.html)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Parses per fixture and parser (default: 50)'
+        )
+
+    def handle(self, *args, **options):
+        sys.path.append(str(settings.BASE_DIR))
+        from mse_scrapper_html import parse_mse_html
+
+        iterations = options['iterations']
+        parsers = (('legacy bs4+pandas', self.legacy_parse), ('lxml in-memory', parse_mse_html))
+
+        for path in options['html']:
+            try:
+                content = Path(path).read_bytes()
+            except OSError as e:
+                raise CommandError(f"Could not read {path}: {e}")
+
+            self.stdout.write(f"\n{path} ({len(content) / 1024:.1f} KB, {iterations} iterations)")
+            results = {}
+            for label, parse in parsers:
+                results[label] = self.measure(parse, content, iterations)
+                avg_ms, peak_kb, count = results[label]
+                self.stdout.write(f"  {label:<20} {avg_ms:8.2f} ms/parse  py-heap peak {peak_kb:9.1f} KB  {count} stocks")
+
+            legacy_ms, legacy_kb, _ = results['legacy bs4+pandas']
+            lxml_ms, lxml_kb, _ = results['lxml in-memory']
+            self.stdout.write(self.style.SUCCESS(
+                f"  lxml is {legacy_ms / lxml_ms:.1f}x faster with {legacy_kb / lxml_kb:.1f}x lower peak memory"
+            ))
+
+    def measure(self, parse, content, iterations):
+        """Return (avg ms per parse, peak KB of one parse, records parsed)
+        
+        Peak memory is the Python heap as seen by tracemalloc; libxml2's own
+        buffers are allocated outside it, so the lxml figure is a lower bound.
+        """
+        # The scraper prints progress while parsing; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            parse(content)  # warm up imports and caches
+
+            started = timer.perf_counter()
+            for _ in range(iterations):
+                parsed = parse(content)
+            avg_ms = (timer.perf_counter() - started) * 1000 / iterations
+
+            tracemalloc.start()
+            parse(content)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return avg_ms, peak / 1024, len(parsed)
+
+    def legacy_parse(self, content):
+        """The pre-lxml scraper path: temp file round-trip, html.parser and a DataFrame"""
+        from bs4 import BeautifulSoup
+        import pandas as pd
+
+        fd, html_file = tempfile.mkstemp(suffix='.html')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content.decode('utf-8'))
+            with open(html_file, 'r', encoding='utf-8') as f:
+                soup = BeautifulSoup(f.read(), 'html.parser')
+        finally:
+            os.remove(html_file)
+
+        update_time_elem = soup.select_one("div.time span:-soup-contains('/')")
+        update_time = update_time_elem.text.strip() if update_time_elem else "Unknown"
+        market_status_elem = soup.select_one("span:-soup-contains('Market Status:') + span")
+        market_status = market_status_elem.text.strip() if market_status_elem else "Unknown"
+
+        data = []
+        for item in soup.select("div.ticker__item"):
+            if len(data) >= 16:
+                break
+            symbol_span = item.select_one("span:first-child")
+            price_span = item.select_one("span.pricedata")
+            change_span = item.select_one("span.changedata")
+            if not symbol_span or not price_span or not change_span:
+                continue
+            price_text = price_span.text.strip().replace(',', '')
+            change_match = re.search(r"\(([-+]?\d+(?:\.\d+)?)\)", change_span.text.strip())
+            classes = price_span.get('class', [])
+            data.append({
+                'Symbol': symbol_span.text.strip(),
+                'Price': float(price_text) if price_text else None,
+                'Change': float(change_match.group(1)) if change_match else 0.0,
+                'Direction': 'up' if 'changeup' in classes else 'down' if 'changedown' in classes else 'no change',
+                'Market_Status': market_status,
+                'Market_Update_Time': update_time,
+            })
+
+        df = pd.DataFrame(data)
+        return df.dropna(subset=['Symbol', 'Price'])
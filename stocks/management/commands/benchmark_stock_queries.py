@@ -0,0 +1,135 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from stocks.management.scratch_db import scratch_database
+from stocks.models import StockPrice
+from datetime import date, datetime, time, timedelta
+import random
+import time as timer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark StockPrice queries on a year of synthetic ticks, with and without indexes'
+    
+    UNINDEXED_TABLE = 'stocks_stockprice_benchmark_unindexed'
+    
+    SYMBOLS = [
+        'AIRTEL', 'BHL', 'FDHB', 'FMBCH', 'ICON', 'ILLOVO',
+        'MPICO', 'NBM', 'NBS', 'NICO', 'NITL', 'OMU',
+        'PCL', 'STANDARD', 'SUNBIRD', 'TNM'
+    ]
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Calendar days of synthetic history (weekends are skipped, default: 365)'
+        )
+        parser.add_argument(
+            '--ticks-per-day',
+            type=int,
+            default=40,
+            help='Scrapes per trading day (default: 40)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Times each query is run (default: 50)'
+        )
+    
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        
+        # Everything happens in a throwaway database, so neither the synthetic
+        # rows nor the unindexed copy of the table touch the live one
+        with scratch_database() as database:
+            self.stdout.write(f"Benchmarking in scratch database {database}")
+            trading_days = self.populate(options['days'], options['ticks_per_day'])
+            self.copy_without_indexes()
+            
+            self.stdout.write(self.style.SUCCESS("\nWithout indexes (before):"))
+            unindexed = self.run_queries(trading_days, self.UNINDEXED_TABLE)
+            
+            self.stdout.write(self.style.SUCCESS("\nWith indexes (after):"))
+            indexed = self.run_queries(trading_days, StockPrice._meta.db_table)
+            
+            self.stdout.write(self.style.SUCCESS("\nSpeedup:"))
+            for name in indexed:
+                speedup = unindexed[name] / indexed[name] if indexed[name] else 0
+                self.stdout.write(f"  {name:<40} {speedup:8.1f}x")
+        
+        self.stdout.write(self.style.SUCCESS("\nScratch database destroyed"))
+    
+    def populate(self, days, ticks_per_day):
+        start = date.today() - timedelta(days=days)
+        trading_days = [
+            start + timedelta(days=offset)
+            for offset in range(days)
+            if (start + timedelta(days=offset)).weekday() < 5
+        ]
+        # Spread the day's scrapes over 09:00-17:00
+        tick_times = [
+            (datetime.combine(date.min, time(9, 0)) + timedelta(seconds=i * 8 * 3600 // ticks_per_day)).time()
+            for i in range(ticks_per_day)
+        ]
+        
+        self.stdout.write(f"Populating {len(trading_days) * len(tick_times) * len(self.SYMBOLS):,} synthetic ticks...")
+        started = timer.perf_counter()
+        batch = []
+        for trading_day in trading_days:
+            for tick_time in tick_times:
+                for symbol in self.SYMBOLS:
+                    batch.append(StockPrice(
+                        symbol=symbol,
+                        price=round(random.uniform(10, 5000), 2),
+                        change=round(random.uniform(-5, 5), 2),
+                        direction='no change',
+                        date=trading_day,
+                        time=tick_time,
+                        market_status='Open',
+                        market_update_time='',
+                    ))
+            if len(batch) >= 5000:
+                StockPrice.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        StockPrice.objects.bulk_create(batch, ignore_conflicts=True)
+        self.stdout.write(f"Populated in {timer.perf_counter() - started:.1f}s")
+        return trading_days
+    
+    def copy_without_indexes(self):
+        """CREATE TABLE ... AS SELECT copies the rows but none of the indexes or constraints"""
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {quote(self.UNINDEXED_TABLE)} AS SELECT * FROM {quote(StockPrice._meta.db_table)}"
+            )
+    
+    def run_queries(self, trading_days, table):
+        trading_day = trading_days[len(trading_days) // 2]
+        queries = {
+            'latest tick for one symbol': StockPrice.objects.filter(
+                symbol='TNM').order_by('-date', '-time')[:1],
+            'one symbol, one day (intraday)': StockPrice.objects.filter(
+                symbol='TNM', date=trading_day).order_by('time'),
+            'exact tick (update_or_create lookup)': StockPrice.objects.filter(
+                symbol='TNM', date=trading_day, time=time(12, 0))[:1],
+            'all symbols as of a time': StockPrice.objects.filter(
+                date=trading_day, time__lte=time(12, 0)).order_by('symbol', 'time'),
+        }
+        
+        quote = connection.ops.quote_name
+        timings = {}
+        with connection.cursor() as cursor:
+            for name, queryset in queries.items():
+                sql, params = queryset.query.sql_with_params()
+                sql = sql.replace(quote(StockPrice._meta.db_table), quote(table))
+                cursor.execute(sql, params)  # Warm up
+                cursor.fetchall()
+                started = timer.perf_counter()
+                for _ in range(self.repeat):
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                timings[name] = (timer.perf_counter() - started) / self.repeat * 1000
+                self.stdout.write(f"  {name:<40} {timings[name]:8.3f} ms")
+        return timings
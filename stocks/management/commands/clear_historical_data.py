@@ -1,9 +1,9 @@
 from django.core.management.base import BaseCommand
 from stocks.models import HistoricalPrice
-from django.core.cache import cache
+from stocks.cache_keys import invalidate
 
 class Command(BaseCommand):
-    help = 'Clear all historical price data and cache'
+    help = 'Clear all historical price data and cached historical payloads'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -34,10 +34,11 @@ class Command(BaseCommand):
         else:
             self.stdout.write('No historical price records found')
 
-        # Clear cache
-        cache.clear()
+        # Expire cached historical payloads (other cache entries are left alone)
+        invalidate('historical')
+        invalidate('historical-stale')
         self.stdout.write(
-            self.style.SUCCESS('Successfully cleared cache')
+            self.style.SUCCESS('Successfully expired cached historical data')
         )
 
         self.stdout.write(
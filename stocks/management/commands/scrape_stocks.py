@@ -71,19 +71,30 @@ class Command(BaseCommand):
             
             # Import and run the scraper function
             sys.path.append(str(base_dir))
-            from mse_scrapper_html import extract_mse_data_html, save_data, save_to_database
+            from mse_scrapper_html import extract_mse_data_html, save_data, save_page_state, save_to_database
             
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Extracting MSE stock data...")
-            df = extract_mse_data_html(force_scrape=force_scrape)
-            if df is not None:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Successfully extracted data for {len(df)} stocks")
-                logger.info(f"Successfully extracted data for {len(df)} stocks")
+            records, page_state = extract_mse_data_html(force_scrape=force_scrape, with_page_state=True)
+            if records == []:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Market data unchanged since last scrape")
+                print(f"{'='*80}")
+                logger.info("Market data unchanged since last scrape, nothing to save")
+                self.stdout.write(self.style.SUCCESS('Market data unchanged since last scrape'))
+            elif records is not None:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Successfully extracted data for {len(records)} stocks")
+                logger.info(f"Successfully extracted data for {len(records)} stocks")
                 
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Saving data to CSV...")
-                save_data(df)  # Save to CSV
+                save_data(records)  # Save to CSV
                 
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Saving data to database...")
-                saved_count = save_to_database(df)  # Save to database
+                save_stats = save_to_database(records)  # Save to database
+                saved_count = save_stats['saved']
+                if save_stats['error'] is not None:
+                    raise RuntimeError(f"Database save failed: {save_stats['error']}")
+                if page_state:
+                    # Only a stored page may be skipped by the next conditional scrape
+                    save_page_state(page_state)
                 
                 end_time = datetime.now()
                 duration = (end_time - start_time).total_seconds()
@@ -92,7 +103,8 @@ class Command(BaseCommand):
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER: Completed in {duration:.2f} seconds")
                 print(f"{'='*80}")
                 
-                logger.info(f"Saved {saved_count} stock records to database")
+                logger.info(f"Saved {saved_count} stock records to database ({save_stats['unchanged']} unchanged) in {save_stats['total_ms']} ms "
+                            f"(parse {save_stats['parse_ms']} ms, write {save_stats['write_ms']} ms)")
                 self.stdout.write(self.style.SUCCESS(f'Successfully scraped and saved {saved_count} stock records'))
             else:
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] SCRAPER ERROR: Failed to extract data")
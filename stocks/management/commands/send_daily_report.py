@@ -3,7 +3,7 @@ from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.db.models import Sum, Avg, Count
-from stocks.models import StockPrice, Company, Subscriber
+from stocks.models import StockPrice, LatestPrice, Company, Subscriber
 import logging
 from datetime import datetime, timedelta
 
@@ -16,31 +16,24 @@ class Command(BaseCommand):
         today = timezone.now().date()
         yesterday = today - timedelta(days=1)
         
-        # Get today's latest stock prices
-        today_prices = StockPrice.objects.filter(date=today).order_by('symbol', '-time')
+        # Get today's latest stock prices (one per symbol)
+        latest_prices = {price.symbol: price for price in LatestPrice.objects.filter(date=today)}
         
         # If no prices for today, try yesterday's data
-        if not today_prices.exists():
+        if not latest_prices:
             self.stdout.write(self.style.WARNING(f"No stock prices found for {today}, using {yesterday}'s data"))
             today = yesterday
-            today_prices = StockPrice.objects.filter(date=yesterday).order_by('symbol', '-time')
+            latest_prices = {price.symbol: price for price in LatestPrice.objects.filter(date=yesterday)}
             
-            if not today_prices.exists():
+            if not latest_prices:
                 self.stdout.write(self.style.ERROR(f"No stock data available for reporting"))
                 return
         
-        # Get unique latest prices (one per symbol)
-        latest_prices = {}
-        for price in today_prices:
-            if price.symbol not in latest_prices:
-                latest_prices[price.symbol] = price
-        
         # Get yesterday's closing prices for comparison
-        yesterday_prices = {}
-        yesterday_data = StockPrice.objects.filter(date=yesterday).order_by('symbol', '-time')
-        for price in yesterday_data:
-            if price.symbol not in yesterday_prices:
-                yesterday_prices[price.symbol] = price
+        yesterday_prices = {
+            price.symbol: price
+            for price in StockPrice.objects.filter(date=yesterday).latest_per_symbol()
+        }
         
         # Prepare stock data with changes
         stocks_data = []
@@ -2,6 +2,9 @@
 """
 Django management command for warming the historical data cache.
 
+Requests run concurrently through the rate-limited historical fetcher and
+fill the same cache entries the API reads.
+
 Usage:
     python manage.py warm_cache --strategy priority
     python manage.py warm_cache --strategy intraday_only
@@ -11,10 +14,8 @@ Usage:
 """
 
 from django.core.management.base import BaseCommand, CommandError
-from django.conf import settings
-import requests
-import time
 from datetime import datetime
+from stocks.services.fetch_service import historical_fetcher
 
 class Command(BaseCommand):
     help = 'Warm the historical data cache by pre-loading API responses'
@@ -42,18 +43,8 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be done without making requests'
         )
-        parser.add_argument(
-            '--api-key',
-            type=str,
-            default='mse_5PFAyspVWQnz33boHidjCIiU2y6aNoEmzZteXzRV',
-            help='API key to use for requests'
-        )
 
     def handle(self, *args, **options):
-        # Configuration
-        base_url = 'http://127.0.0.1:8000/api/historical'
-        api_key = options['api_key']
-        
         all_symbols = [
             'AIRTEL', 'BHL', 'FDHB', 'FMBCH', 'ICON', 'ILLOVO',
             'MPICO', 'NBM', 'NBS', 'NICO', 'NITL', 'OMU',
@@ -118,47 +109,25 @@ class Command(BaseCommand):
         successful = 0
         failed = 0
         
-        headers = {
-            'X-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
-        
         self.stdout.write(self.style.SUCCESS(f"\nStarting cache warming..."))
         
-        for i, symbol in enumerate(symbols):
-            self.stdout.write(f"\nWarming cache for {symbol} ({i+1}/{len(symbols)}):")
-            
-            for time_range in ranges:
-                try:
-                    url = f"{base_url}/{symbol}/"
-                    params = {'range': time_range, 'refresh': 'true'}
-                    
-                    self.stdout.write(f"  {symbol} {time_range}... ", ending='')
-                    
-                    response = requests.get(url, params=params, headers=headers, timeout=30)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        points = data.get('data_points', 0)
-                        source = data.get('source', 'unknown')
-                        self.stdout.write(
-                            self.style.SUCCESS(f"✓ {points} points (source: {source})")
-                        )
-                        successful += 1
-                    else:
-                        self.stdout.write(
-                            self.style.ERROR(f"✗ HTTP {response.status_code}")
-                        )
-                        failed += 1
-                        
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f"✗ Error: {str(e)}")
-                    )
-                    failed += 1
-                
-                # Small delay to be nice to the server
-                time.sleep(0.2)
+        # Results come back in symbol, range order once the whole batch is done
+        results = historical_fetcher.fetch_many(symbols, ranges, save=True)
+        
+        for result in results:
+            self.stdout.write(f"  {result.symbol} {result.time_range}... ", ending='')
+            if result.data:
+                points = result.data.get('data_points', 0)
+                source = result.data.get('source', 'unknown')
+                self.stdout.write(
+                    self.style.SUCCESS(f"✓ {points} points (source: {source})")
+                )
+                successful += 1
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f"✗ Error: {result.error}" if result.error else "✗ No data")
+                )
+                failed += 1
         
         # Summary
         duration = datetime.now() - start_time
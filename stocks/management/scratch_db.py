@@ -0,0 +1,32 @@
+"""
+Throwaway database for the benchmark commands.
+
+The benchmarks write hundreds of thousands of rows. In the live database that
+would hold SQLite's write lock for the whole run and block the scraper, the
+usage flusher and the quota sync of a running deployment, so they run against
+a freshly migrated test database instead. On SQLite it is a temporary file
+rather than the in-memory default, so timings still include disk I/O.
+"""
+from django.db import connection
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def scratch_database():
+    """Point the default connection at a new test database for the block, then destroy it"""
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    test_name = test_settings.get('NAME')
+    live_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        test_settings['NAME'] = os.path.join(tempfile.gettempdir(), f"mse-benchmark-{os.getpid()}.sqlite3")
+
+    try:
+        scratch_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield scratch_name
+        finally:
+            connection.creation.destroy_test_db(live_name, verbosity=0)
+    finally:
+        test_settings['NAME'] = test_name
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:14
+
+from django.db import migrations, models
+
+
+TICK_FIELDS = ['price', 'change', 'direction', 'date', 'time', 'market_status', 'market_update_time']
+
+
+def populate_latest_prices(apps, schema_editor):
+    StockPrice = apps.get_model('stocks', 'StockPrice')
+    LatestPrice = apps.get_model('stocks', 'LatestPrice')
+
+    latest = {}
+    for tick in StockPrice.objects.order_by('symbol', '-date', '-time', '-id').iterator():
+        if tick.symbol not in latest:
+            latest[tick.symbol] = LatestPrice(
+                symbol=tick.symbol,
+                **{field: getattr(tick, field) for field in TICK_FIELDS}
+            )
+    LatestPrice.objects.bulk_create(latest.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0004_subscriber'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestPrice',
+            fields=[
+                ('symbol', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('price', models.FloatField()),
+                ('change', models.FloatField()),
+                ('direction', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('market_status', models.CharField(max_length=20)),
+                ('market_update_time', models.CharField(max_length=30)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['symbol'],
+            },
+        ),
+        migrations.RunPython(populate_latest_prices, migrations.RunPython.noop),
+    ]
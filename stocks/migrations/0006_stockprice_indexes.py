@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:15
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_ticks(apps, schema_editor):
+    """Keep the newest row of each (symbol, date, time) so the constraint can be added"""
+    StockPrice = apps.get_model('stocks', 'StockPrice')
+    duplicates = (
+        StockPrice.objects
+        .values('symbol', 'date', 'time')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        StockPrice.objects.filter(
+            symbol=duplicate['symbol'],
+            date=duplicate['date'],
+            time=duplicate['time'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0005_latestprice'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ticks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='stockprice',
+            index=models.Index(fields=['date', 'time'], name='stockprice_date_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockprice',
+            constraint=models.UniqueConstraint(fields=('symbol', 'date', 'time'), name='stockprice_unique_tick'),
+        ),
+    ]
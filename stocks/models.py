@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 import uuid
 
 class Company(models.Model):
@@ -39,6 +41,16 @@ class Company(models.Model):
     def __str__(self):
         return f"{self.symbol} - {self.name}"
 
+class StockPriceQuerySet(models.QuerySet):
+    def latest_per_symbol(self):
+        """Newest tick of each symbol within this queryset, in one query"""
+        return self.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=[F('symbol')],
+            order_by=[F('date').desc(), F('time').desc(), F('id').desc()],
+        )).filter(row_number=1)
+
+
 class StockPrice(models.Model):
     symbol = models.CharField(max_length=20)
     price = models.FloatField()
@@ -50,12 +62,89 @@ class StockPrice(models.Model):
     market_update_time = models.CharField(max_length=30)
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    objects = StockPriceQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-date', '-time', 'symbol']
+        constraints = [
+            # Also serves as the (symbol, date, time) index for per-symbol lookups
+            models.UniqueConstraint(fields=['symbol', 'date', 'time'], name='stockprice_unique_tick'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'time'], name='stockprice_date_time_idx'),  # Cross-symbol snapshots
+        ]
         
     def __str__(self):
         return f"{self.symbol} ({self.date}): {self.price}"
 
+class LatestPrice(models.Model):
+    """
+    Newest StockPrice tick per symbol, kept up to date by the scraper so
+    "current price" lookups never scan the tick history
+    """
+    symbol = models.CharField(max_length=20, primary_key=True)
+    price = models.FloatField()
+    change = models.FloatField()
+    direction = models.CharField(max_length=10)
+    date = models.DateField()
+    time = models.TimeField()
+    market_status = models.CharField(max_length=20)
+    market_update_time = models.CharField(max_length=30)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    TICK_FIELDS = ['price', 'change', 'direction', 'date', 'time', 'market_status', 'market_update_time']
+    
+    class Meta:
+        ordering = ['symbol']
+    
+    def __str__(self):
+        return f"{self.symbol} ({self.date} {self.time}): {self.price}"
+    
+    @classmethod
+    def update_from_tick(cls, tick):
+        """Upsert the row for tick.symbol unless it already holds a newer tick"""
+        return cls.update_from_ticks([tick]) == 1
+    
+    @classmethod
+    def update_from_ticks(cls, ticks):
+        """
+        Upsert the rows for a batch of ticks in one statement, skipping
+        symbols whose stored tick is newer. Returns the number of rows written.
+        """
+        current = {
+            symbol: (row_date, row_time)
+            for symbol, row_date, row_time in cls.objects.filter(
+                symbol__in=[tick.symbol for tick in ticks]
+            ).values_list('symbol', 'date', 'time')
+        }
+        newest = {}
+        for tick in ticks:
+            stamp = (tick.date, tick.time)
+            if stamp < current.get(tick.symbol, stamp) or stamp < newest.get(tick.symbol, (stamp, None))[0]:
+                continue
+            newest[tick.symbol] = (stamp, tick)
+        
+        cls.objects.bulk_create(
+            [
+                cls(symbol=symbol, **{field: getattr(tick, field) for field in cls.TICK_FIELDS})
+                for symbol, (_, tick) in newest.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['symbol'],
+            update_fields=cls.TICK_FIELDS + ['updated_at'],
+        )
+        return len(newest)
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every row from StockPrice"""
+        latest = StockPrice.objects.latest_per_symbol()
+        cls.objects.all().delete()
+        cls.objects.bulk_create([
+            cls(symbol=tick.symbol, **{field: getattr(tick, field) for field in cls.TICK_FIELDS})
+            for tick in latest
+        ])
+
 class HistoricalPrice(models.Model):
     """Model for storing historical stock prices with OHLC data"""
     symbol = models.CharField(max_length=20, db_index=True)
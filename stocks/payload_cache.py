@@ -0,0 +1,66 @@
+"""
+Pre-rendered JSON bodies for historical responses.
+
+A payload is stored as the final encoded bytes under the key of the dict it
+was rendered from plus the data-version stamp of its symbol (see
+data_versions.py), so a hit is served without decoding the dict or running
+the renderer again. The per-request fields, source and retrieved_at, are
+sent as X-Data-Source and X-Retrieved-At headers instead of being written
+into the cached body. Each payload carries a digest of its bytes, under
+which the compression middleware (config/compression.py) caches its
+gzip/brotli variants.
+"""
+from collections import namedtuple
+from datetime import datetime
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# body: rendered JSON without 'source'; retrieved_at: ISO string or None; digest: md5 of body
+RenderedPayload = namedtuple('RenderedPayload', ['body', 'retrieved_at', 'digest'], defaults=[None])
+
+
+def _key(source_key, version):
+    stamp = version.timestamp() if version else 'none'
+    return f"{source_key}:rendered:{stamp}"
+
+
+def get(source_key, version):
+    """The RenderedPayload for a cached dict at a data version, or None"""
+    return cache.get(_key(source_key, version))
+
+
+def render(data, renderer):
+    """RenderedPayload of a payload dict, without storing it"""
+    body = renderer.render({k: v for k, v in data.items() if k != 'source'})
+    return RenderedPayload(body, data.get('retrieved_at'), hashlib.md5(body).hexdigest())
+
+
+def put(source_key, version, data, renderer, timeout):
+    """Render a payload dict once and store the bytes for timeout seconds"""
+    payload = render(data, renderer)
+    if timeout > 0:
+        cache.set(_key(source_key, version), payload, timeout)
+    return payload
+
+
+def age(payload):
+    """Seconds since a payload's data was retrieved from MSE"""
+    try:
+        retrieved_at = datetime.fromisoformat(payload.retrieved_at)
+    except (TypeError, ValueError):
+        return 0
+    return max(0, int((datetime.now() - retrieved_at).total_seconds()))
+
+
+def response(payload, source, content_type, age=None):
+    """HttpResponse carrying the stored bytes as-is"""
+    response = HttpResponse(payload.body, content_type=content_type)
+    response.payload_digest = payload.digest
+    response['X-Data-Source'] = source
+    if payload.retrieved_at:
+        response['X-Retrieved-At'] = payload.retrieved_at
+    if age is not None:
+        response['Age'] = str(age)
+    return response
@@ -0,0 +1,91 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import date
+import threading
+import logging
+
+from stocks.models import StockPrice
+
+logger = logging.getLogger(__name__)
+
+
+class AsOfIndex:
+    """
+    Sorted in-memory index of one trading day's ticks, answering
+    "price of every symbol as of time T" without further queries
+    """
+    
+    def __init__(self, trading_date, ticks):
+        self.date = trading_date
+        self._times = {}
+        self._ticks = {}
+        for tick in ticks:  # Ordered by symbol, time
+            self._times.setdefault(tick.symbol, []).append(tick.time)
+            self._ticks.setdefault(tick.symbol, []).append(tick)
+    
+    @classmethod
+    def build(cls, trading_date):
+        """Load a day's ticks with a single query"""
+        ticks = StockPrice.objects.filter(date=trading_date).order_by('symbol', 'time', 'id')
+        return cls(trading_date, ticks)
+    
+    @property
+    def symbols(self):
+        return sorted(self._ticks)
+    
+    def as_of(self, query_time, symbols=None):
+        """
+        Tick at or before query_time for each symbol, sorted by symbol.
+        Symbols with no tick that early fall back to their first tick of the day.
+        """
+        result = []
+        for symbol in symbols or self.symbols:
+            times = self._times.get(symbol)
+            if not times:
+                continue
+            position = bisect_right(times, query_time)
+            result.append(self._ticks[symbol][max(position - 1, 0)])
+        return result
+    
+    def latest(self, symbols=None):
+        """Last tick of the day for each symbol, sorted by symbol"""
+        return [self._ticks[symbol][-1] for symbol in symbols or self.symbols if symbol in self._ticks]
+
+
+class AsOfIndexCache:
+    """
+    Keeps indexes of past trading days, which no longer change, in a small
+    LRU; the current day is rebuilt on every request
+    """
+    
+    def __init__(self, max_days=32):
+        self.max_days = max_days
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, trading_date):
+        if trading_date >= date.today():
+            return AsOfIndex.build(trading_date)
+        
+        with self._lock:
+            index = self._indexes.get(trading_date)
+            if index is not None:
+                self._indexes.move_to_end(trading_date)
+                return index
+        
+        index = AsOfIndex.build(trading_date)
+        with self._lock:
+            self._indexes[trading_date] = index
+            while len(self._indexes) > self.max_days:
+                self._indexes.popitem(last=False)
+        return index
+    
+    def invalidate(self, trading_date=None):
+        with self._lock:
+            if trading_date is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(trading_date, None)
+
+
+asof_indexes = AsOfIndexCache()
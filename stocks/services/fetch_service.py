@@ -0,0 +1,163 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import connection
+
+from stocks.services.historical_service import FetchedPrices, MSEHistoricalService
+
+logger = logging.getLogger(__name__)
+
+FetchResult = namedtuple('FetchResult', ['symbol', 'time_range', 'data', 'saved', 'error'])
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PoliteSession(requests.Session):
+    """
+    Keep-alive session shared by all fetch threads. Every request waits for
+    the global rate limiter and a per-host slot, and connection errors, 429s
+    and 5xx responses are retried with jittered exponential backoff.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, requests_per_second, per_host_concurrency, max_retries, backoff, backoff_max):
+        super().__init__()
+        self.headers.update(MSEHistoricalService.DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=per_host_concurrency)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.per_host_concurrency = per_host_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_concurrency)
+            return self._host_slots[host]
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter delay before retry number `attempt` (0-based)"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, *args, **kwargs):
+        slot = self._host_slot(url)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                with slot:
+                    response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                delay = self.backoff_delay(attempt, float(retry_after) if retry_after and retry_after.isdigit() else None)
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class HistoricalFetcher:
+    """Fetches many (symbol, range) pairs concurrently through one PoliteSession"""
+
+    def __init__(self, max_workers=4, requests_per_second=2.0, per_host_concurrency=2,
+                 max_retries=3, backoff=1.0, backoff_max=30.0):
+        self.max_workers = max_workers
+        self.session = PoliteSession(requests_per_second, per_host_concurrency, max_retries, backoff, backoff_max)
+        self.service = MSEHistoricalService(session=self.session)
+
+    def _fetch_one(self, symbol, time_range):
+        """
+        Runs on a pool thread and never writes to the database: returns a
+        cached payload, intraday data, or the FetchedPrices for fetch_many
+        to store on the calling thread.
+        """
+        try:
+            if time_range == '1day':
+                return self.service.get_historical_data(symbol, time_range), None
+            cached = self.service.cached_historical_data(symbol, time_range)
+            if cached:
+                return cached, None
+            return self.service.fetch_remote(symbol, time_range), None
+        except Exception as e:
+            logger.error(f"Error fetching {symbol} {time_range}: {e}")
+            return None, str(e)
+        finally:
+            # Pool threads would otherwise each keep a database connection open
+            connection.close()
+
+    def fetch_many(self, symbols, ranges, save=False):
+        """
+        Fetch every range of every symbol.
+
+        Args:
+            symbols (list): Stock symbols
+            ranges (list): Time ranges (see MSEHistoricalService.TIME_PERIOD_MAP)
+            save (bool): Store full-range fetches in HistoricalPrice (deltas
+                after the newest stored date are always stored). All writes
+                run on the calling thread as results arrive, one at a time.
+
+        Returns:
+            list: FetchResult per (symbol, range), in input order
+        """
+        pairs = [(symbol, time_range) for symbol in symbols for time_range in ranges]
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='MSE-HistoricalFetch') as pool:
+            futures = [pool.submit(self._fetch_one, symbol, time_range) for symbol, time_range in pairs]
+            for (symbol, time_range), future in zip(pairs, futures):
+                data, error = future.result()
+                saved = 0
+                if isinstance(data, FetchedPrices):
+                    try:
+                        data, saved = self.service.store_fetched(symbol, time_range, data, save=save)
+                    except Exception as e:
+                        logger.error(f"Error saving {symbol} {time_range}: {e}")
+                        data, error = None, str(e)
+                results.append(FetchResult(symbol, time_range, data, saved, error))
+        return results
+
+
+historical_fetcher = HistoricalFetcher(
+    max_workers=getattr(settings, 'HISTORICAL_FETCH_WORKERS', 4),
+    requests_per_second=getattr(settings, 'HISTORICAL_FETCH_RATE', 2.0),
+    per_host_concurrency=getattr(settings, 'HISTORICAL_FETCH_PER_HOST', 2),
+    max_retries=getattr(settings, 'HISTORICAL_FETCH_MAX_RETRIES', 3),
+    backoff=getattr(settings, 'HISTORICAL_FETCH_BACKOFF', 1.0),
+    backoff_max=getattr(settings, 'HISTORICAL_FETCH_BACKOFF_MAX', 30.0),
+)
@@ -3,14 +3,24 @@ from bs4 import BeautifulSoup
 import re
 import json
 import logging
+from collections import namedtuple
 from datetime import datetime, date, timedelta
 from stocks.models import Company, HistoricalPrice
 from django.db import transaction
+from django.db.models import Max, Min
+from django.conf import settings
 from django.core.cache import cache
+from stocks.services.singleflight import historical_single_flight
+from stocks.cache_keys import invalidate, versioned_key
+from stocks import data_versions
 import time
 
 logger = logging.getLogger(__name__)
 
+# What fetch_remote() got from MSE: kind 'delta' (points after the newest
+# stored date, fetched as delta_range) or 'full' (the whole range)
+FetchedPrices = namedtuple('FetchedPrices', ['kind', 'points', 'delta_range'])
+
 class MSEHistoricalService:
     """Service to fetch historical stock data from MSE website"""
     
@@ -26,17 +36,27 @@ class MSEHistoricalService:
         '5years': 60
     }
     
-    def __init__(self):
-        self.session = requests.Session()
-        # Set headers to mimic a real browser
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html, */*; q=0.01',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',        })
+    # Headers to mimic a real browser
+    DEFAULT_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'text/html, */*; q=0.01',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    }
+    
+    def __init__(self, session=None):
+        """
+        Args:
+            session (requests.Session): Shared session to send requests through
+                (e.g. the rate-limited one in fetch_service); a private one by default
+        """
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.DEFAULT_HEADERS)
+        self.session = session
         
     def get_company_id_from_symbol(self, symbol):
         """
@@ -65,13 +85,16 @@ class MSEHistoricalService:
         
         return symbol_to_id.get(symbol.upper())
     
-    def get_historical_data(self, symbol, time_range):
+    def get_historical_data(self, symbol, time_range, incremental=None):
         """
         Fetch historical stock data from MSE website
         
         Args:
             symbol (str): Stock symbol
             time_range (str): Time range (1month, 3months, 6months, 1year, 2years, 5years)
+            incremental (bool): Serve from HistoricalPrice plus a small fetch of
+                the missing days when the database already covers the range
+                (defaults to settings.HISTORICAL_INCREMENTAL_SYNC)
             
         Returns:
             dict: Historical data or None if error
@@ -81,11 +104,11 @@ class MSEHistoricalService:
             return self.get_intraday_data(symbol)
             
         # Check cache first for historical data
-        cache_key = f"historical_{symbol}_{time_range}_{date.today().isoformat()}"
-        cached_data = cache.get(cache_key)
+        cached_data = self.cached_historical_data(symbol, time_range)
         if cached_data:
             logger.info(f"Returning cached data for {symbol} {time_range}")
             return cached_data
+        cache_key = self.historical_cache_key(symbol, time_range)
             
         # Get company ID
         company_id = self.get_company_id_from_symbol(symbol)
@@ -97,61 +120,133 @@ class MSEHistoricalService:
         if period_num is None:
             logger.error(f"Invalid time range: {time_range}")
             return None
-            
-        # Build URL and make request
-        url = f"{self.BASE_URL}{company_id}/{period_num}"
         
+        if incremental is None:
+            incremental = getattr(settings, 'HISTORICAL_INCREMENTAL_SYNC', True)
+        
+        # Only one fetch per key runs at a time; concurrent misses wait for it.
+        # Storing new dates moves the symbol to a new key generation, so waiters
+        # re-resolve the key rather than polling the one they missed on.
+        result, shared = historical_single_flight.do(
+            cache_key,
+            lambda: self._fetch_and_cache(symbol, time_range, incremental),
+            lambda: cache.get(self.historical_cache_key(symbol, time_range)),
+        )
+        if shared and result:
+            logger.info(f"Returning data for {symbol} {time_range} fetched by a concurrent request")
+            return {**result, 'source': 'cache'}
+        return result
+    
+    # Seconds a cached range is fresh (soft) and may still be served stale (hard)
+    DEFAULT_CACHE_TTLS = {
+        '1month': {'soft': 21600, 'hard': 172800},
+        '3months': {'soft': 21600, 'hard': 172800},
+        '6months': {'soft': 86400, 'hard': 604800},
+        '1year': {'soft': 86400, 'hard': 604800},
+        '2years': {'soft': 86400, 'hard': 604800},
+        '5years': {'soft': 86400, 'hard': 604800},
+    }
+    
+    def cache_ttls(self, time_range):
+        """(soft, hard) TTLs for a range, overridable with settings.HISTORICAL_CACHE_TTLS"""
+        ttls = getattr(settings, 'HISTORICAL_CACHE_TTLS', self.DEFAULT_CACHE_TTLS).get(
+            time_range, self.DEFAULT_CACHE_TTLS.get(time_range, {'soft': 86400, 'hard': 604800})
+        )
+        return ttls['soft'], ttls['hard']
+    
+    @staticmethod
+    def historical_cache_key(symbol, time_range):
+        """Key of today's payload for a range"""
+        return versioned_key('historical', symbol, time_range, date.today().isoformat())
+    
+    def cached_historical_data(self, symbol, time_range):
+        """Today's cached payload for a range with source 'cache', or None"""
+        cached_data = cache.get(self.historical_cache_key(symbol, time_range))
+        return {**cached_data, 'source': 'cache'} if cached_data else None
+    
+    @staticmethod
+    def stale_cache_key(symbol, time_range):
+        """
+        Key of the last good payload, kept past the day's cache entry for
+        stale-while-revalidate. It has its own namespace so that storing new
+        dates, which expires the 'historical' keys, doesn't also drop the copy
+        meant to cover the refresh.
+        """
+        return versioned_key('historical-stale', symbol, time_range)
+    
+    def fetch_remote(self, symbol, time_range, incremental=None):
+        """
+        Network half of a fetch: only the days after the newest stored date
+        when HistoricalPrice already covers the range, else the whole range.
+        Reads the database but never writes to it, so it is safe on worker
+        threads; pass the result to store_fetched().
+        
+        Returns:
+            FetchedPrices or None if MSE returned no data
+        """
+        if incremental is None:
+            incremental = getattr(settings, 'HISTORICAL_INCREMENTAL_SYNC', True)
+        
+        if incremental:
+            covered, delta_range = self._incremental_delta_range(symbol, time_range)
+            if covered:
+                delta = self._fetch_chart_data(symbol, delta_range) if delta_range else []
+                return FetchedPrices('delta', delta or [], delta_range)
+        
+        chart_data = self._fetch_chart_data(symbol, time_range)
+        if not chart_data:
+            logger.warning(f"No chart data found for {symbol} in {time_range}")
+            return None
+        return FetchedPrices('full', chart_data, None)
+    
+    def store_fetched(self, symbol, time_range, fetched, save=True):
+        """
+        Write a fetch_remote() result to HistoricalPrice, then cache the payload.
+        
+        The writes come first and the cache keys are built after them: new
+        dates move the symbol to a new 'historical' key generation, which would
+        otherwise orphan the entries just cached. Deltas are always stored
+        (the payload is read back from the database); full ranges only when
+        save is True.
+        
+        Returns:
+            tuple: (payload dict, number of newly inserted rows)
+        """
+        inserted = 0
+        if fetched.kind == 'delta':
+            if fetched.points:
+                inserted = self.upsert_historical_prices(
+                    symbol, {'stock_prices': fetched.points}, invalidate_cache=False
+                )['inserted']
+                logger.info(f"Incremental sync for {symbol}: fetched {fetched.delta_range} ({inserted} new points)")
+            chart_data = self._chart_data_from_db(symbol, self._range_start(time_range))
+            result = self._build_result(symbol, time_range, chart_data, 'incremental')
+            result['delta_range'] = fetched.delta_range
+        else:
+            result = self._build_result(symbol, time_range, fetched.points, 'mse.co.mw')
+            if save:
+                inserted = self.upsert_historical_prices(symbol, result, invalidate_cache=False)['inserted']
+        
+        if inserted:
+            # New dates change every range of this symbol; other symbols keep their entries
+            invalidate('historical', symbol)
+        
+        # Fresh for the soft TTL; the undated stale copy may be served for
+        # up to the hard TTL while a refresh runs
+        soft_ttl, hard_ttl = self.cache_ttls(time_range)
+        cache.set(self.historical_cache_key(symbol, time_range), result, soft_ttl)
+        cache.set(self.stale_cache_key(symbol, time_range), result, hard_ttl)
+        return result, inserted
+    
+    def _fetch_and_cache(self, symbol, time_range, incremental):
+        """Fetch a range (incrementally when possible), store it and cache the result"""
         try:
-            # Set additional headers for this specific request
-            headers = {
-                'Referer': f"{self.BASE_URL}{company_id}",
-                'Origin': 'https://mse.co.mw',
-                'X-Requested-With': 'XMLHttpRequest',
-            }
-            
-            logger.info(f"Fetching data from: {url}")
-            response = self.session.post(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            # Parse the response to extract chart data
-            chart_data = self._extract_chart_data(response.text, symbol)
-            
-            if not chart_data:
-                logger.warning(f"No chart data found for {symbol} in {time_range}")
+            fetched = self.fetch_remote(symbol, time_range, incremental)
+            if fetched is None:
                 return None
+            result, inserted = self.store_fetched(symbol, time_range, fetched)
             
-            # Check if we have sufficient data for the requested time range
-            expected_points = self._get_expected_data_points(time_range)
-            actual_points = len(chart_data)
-            data_limitation = None
-            
-            if actual_points < expected_points * 0.7:  # Less than 70% of expected data
-                data_limitation = f"Limited data available: {actual_points} points (expected ~{expected_points})"
-                logger.warning(f"Limited data for {symbol} {time_range}: {actual_points}/{expected_points} points")
-                
-            # Prepare result
-            result = {
-                'company': {
-                    'symbol': symbol,
-                    'name': self._get_company_name(symbol),
-                },
-                'time_range': time_range,
-                'stock_prices': chart_data,
-                'retrieved_at': datetime.now().isoformat(),
-                'data_points': len(chart_data),
-                'source': 'mse.co.mw'
-            }
-            
-            # Add data limitation warning if applicable
-            if data_limitation:
-                result['data_limitation'] = data_limitation
-                result['note'] = "MSE website may not have complete historical data for this time range"
-            
-            # Cache the result for 6 hours for recent data, 24 hours for older data
-            cache_timeout = 21600 if time_range in ['1month', '3months'] else 86400
-            cache.set(cache_key, result, cache_timeout)
-            
-            logger.info(f"Successfully fetched {len(chart_data)} data points for {symbol} {time_range}")
+            logger.info(f"Successfully fetched {result['data_points']} data points for {symbol} {time_range} ({result['source']}, {inserted} new)")
             return result
             
         except requests.exceptions.RequestException as e:
@@ -161,6 +256,119 @@ class MSEHistoricalService:
             logger.error(f"Error fetching data for {symbol} {time_range}: {str(e)}")
             return None
     
+    def _fetch_chart_data(self, symbol, time_range):
+        """POST the chart request for one symbol and range and parse the points"""
+        company_id = self.get_company_id_from_symbol(symbol)
+        period_num = self.TIME_PERIOD_MAP[time_range]
+        
+        # Build URL and make request
+        url = f"{self.BASE_URL}{company_id}/{period_num}"
+        
+        # Set additional headers for this specific request
+        headers = {
+            'Referer': f"{self.BASE_URL}{company_id}",
+            'Origin': 'https://mse.co.mw',
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+        
+        logger.info(f"Fetching data from: {url}")
+        response = self.session.post(url, headers=headers, timeout=30)
+        response.raise_for_status()
+        
+        # Parse the response to extract chart data
+        return self._extract_chart_data(response.text, symbol)
+    
+    def _build_result(self, symbol, time_range, chart_data, source):
+        """Wrap chart points in the response payload"""
+        # Check if we have sufficient data for the requested time range
+        expected_points = self._get_expected_data_points(time_range)
+        actual_points = len(chart_data)
+        data_limitation = None
+        
+        if actual_points < expected_points * 0.7:  # Less than 70% of expected data
+            data_limitation = f"Limited data available: {actual_points} points (expected ~{expected_points})"
+            logger.warning(f"Limited data for {symbol} {time_range}: {actual_points}/{expected_points} points")
+            
+        # Prepare result
+        result = {
+            'company': {
+                'symbol': symbol,
+                'name': self._get_company_name(symbol),
+            },
+            'time_range': time_range,
+            'stock_prices': chart_data,
+            'retrieved_at': datetime.now().isoformat(),
+            'data_points': len(chart_data),
+            'source': source
+        }
+        
+        # Add data limitation warning if applicable
+        if data_limitation:
+            result['data_limitation'] = data_limitation
+            result['note'] = "MSE website may not have complete historical data for this time range"
+        
+        return result
+    
+    # How far after the start of a range the oldest stored point may be for
+    # the database to count as covering it
+    INCREMENTAL_COVERAGE_SLACK_DAYS = 7
+    
+    def _range_start(self, time_range):
+        return date.today() - timedelta(days=round(self.TIME_PERIOD_MAP[time_range] * 30.44))
+    
+    def _smallest_range_covering(self, days):
+        """Shortest range whose window reaches `days` back (with a few days' margin)"""
+        for time_range, months in sorted(self.TIME_PERIOD_MAP.items(), key=lambda item: item[1]):
+            if months and months * 30 >= days + 3:
+                return time_range
+        return None
+    
+    def _incremental_delta_range(self, symbol, time_range):
+        """
+        (covered, delta_range): whether HistoricalPrice can serve the range,
+        and the range to fetch for the days after its newest date (None when
+        it is up to date).
+        
+        Not covered when the database is missing the start of the range, or
+        when the gap is so large that the delta fetch would be as big as the
+        full one.
+        """
+        range_start = self._range_start(time_range)
+        bounds = HistoricalPrice.objects.filter(symbol=symbol).aggregate(oldest=Min('date'), newest=Max('date'))
+        if bounds['oldest'] is None or bounds['oldest'] > range_start + timedelta(days=self.INCREMENTAL_COVERAGE_SLACK_DAYS):
+            return False, None
+        
+        gap_days = (date.today() - bounds['newest']).days
+        if gap_days <= 0:
+            return True, None
+        delta_range = self._smallest_range_covering(gap_days)
+        if delta_range is None or self.TIME_PERIOD_MAP[delta_range] >= self.TIME_PERIOD_MAP[time_range]:
+            return False, None
+        return True, delta_range
+    
+    def _chart_data_from_db(self, symbol, start_date):
+        """Stored prices since start_date in the same shape as _extract_chart_data"""
+        rows = (
+            HistoricalPrice.objects
+            .filter(symbol=symbol, date__gte=start_date)
+            .order_by('date')
+            .values_list('date', 'price', 'close_price', 'open_price', 'high', 'low', 'volume', 'turnover')
+        )
+        as_float = lambda value: float(value) if value is not None else None
+        return [
+            {
+                'date': price_date.isoformat(),
+                'price': float(price),
+                'close': float(close_price if close_price is not None else price),
+                'open': as_float(open_price),
+                'high': as_float(high),
+                'low': as_float(low),
+                'volume': volume,
+                'turnover': as_float(turnover)
+            }
+            for price_date, price, close_price, open_price, high, low, volume, turnover in rows
+        ]
+    
     def _extract_chart_data(self, html_content, symbol):
         """
         Extract chart data from the HTML response
@@ -235,11 +443,21 @@ class MSEHistoricalService:
             return symbol
     
     @transaction.atomic
-    def save_to_database(self, symbol, historical_data):
-        """Save historical data to database"""
+    def save_to_database(self, symbol, historical_data, bulk=True):
+        """
+        Save historical data to database
+        
+        Returns the number of newly created rows. With bulk=True (default)
+        rows are written by upsert_historical_prices; bulk=False keeps the
+        original row-by-row update_or_create path.
+        """
         if not historical_data or 'stock_prices' not in historical_data:
             logger.warning(f"No historical data to save for {symbol}")
             return 0
+        
+        if bulk:
+            counts = self.upsert_historical_prices(symbol, historical_data)
+            return counts['inserted']
             
         # Get or create company
         try:
@@ -276,9 +494,83 @@ class MSEHistoricalService:
             except Exception as e:
                 logger.error(f"Error saving price data for {symbol} on {price_data.get('date')}: {e}")
                 
+        if saved_count:
+            transaction.on_commit(lambda: invalidate('historical', symbol))
+        transaction.on_commit(lambda: data_versions.touch(f"historical:{symbol}"))
+        
         logger.info(f"Saved {saved_count} new historical prices for {symbol}")
         return saved_count
     
+    UPSERT_FIELDS = ['company', 'price', 'close_price', 'open_price', 'high', 'low', 'volume', 'turnover', 'last_updated']
+    
+    @transaction.atomic
+    def upsert_historical_prices(self, symbol, historical_data, chunk_size=500, invalidate_cache=True):
+        """
+        Insert or update historical prices in chunks with
+        bulk_create(update_conflicts=True)
+        
+        New dates expire the symbol's cached payloads on commit, unless
+        invalidate_cache is False because the caller does it itself.
+        
+        Returns:
+            dict: {'inserted': int, 'updated': int}
+        """
+        counts = {'inserted': 0, 'updated': 0}
+        if not historical_data or 'stock_prices' not in historical_data:
+            logger.warning(f"No historical data to save for {symbol}")
+            return counts
+        
+        # Looked up once for the whole series
+        company = Company.objects.filter(symbol=symbol).first()
+        if company is None:
+            logger.warning(f"Company {symbol} not found in database")
+        
+        # One row per date; a later point for the same date wins
+        rows = {}
+        for price_data in historical_data['stock_prices']:
+            try:
+                price_date = datetime.fromisoformat(price_data['date']).date()
+                rows[price_date] = HistoricalPrice(
+                    symbol=symbol,
+                    date=price_date,
+                    company=company,
+                    price=price_data['price'],
+                    close_price=price_data['close'],
+                    open_price=price_data.get('open'),
+                    high=price_data.get('high'),
+                    low=price_data.get('low'),
+                    volume=price_data.get('volume'),
+                    turnover=price_data.get('turnover'),
+                )
+            except Exception as e:
+                logger.error(f"Error parsing price data for {symbol} on {price_data.get('date')}: {e}")
+        
+        rows = list(rows.values())
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            existing = set(
+                HistoricalPrice.objects
+                .filter(symbol=symbol, date__in=[row.date for row in chunk])
+                .values_list('date', flat=True)
+            )
+            HistoricalPrice.objects.bulk_create(
+                chunk,
+                update_conflicts=True,
+                unique_fields=['symbol', 'date'],
+                update_fields=self.UPSERT_FIELDS,
+            )
+            counts['updated'] += len(existing)
+            counts['inserted'] += len(chunk) - len(existing)
+        
+        if counts['inserted'] and invalidate_cache:
+            # New dates change every range of this symbol; other symbols keep their entries
+            transaction.on_commit(lambda: invalidate('historical', symbol))
+        if rows:
+            transaction.on_commit(lambda: data_versions.touch(f"historical:{symbol}"))
+        
+        logger.info(f"Upserted historical prices for {symbol}: {counts['inserted']} inserted, {counts['updated']} updated")
+        return counts
+    
     def _get_expected_data_points(self, time_range):
         """Get expected number of data points for a time range (assuming ~20 trading days per month)"""
         expected_map = {
@@ -307,7 +599,7 @@ class MSEHistoricalService:
             target_date = date.today()
         
         # Get all prices for this symbol from the target date, ordered by time
-        from stocks.models import StockPrice
+        from stocks.models import StockPrice, LatestPrice
         intraday_prices = StockPrice.objects.filter(
             symbol=symbol.upper(),
             date=target_date
@@ -317,9 +609,9 @@ class MSEHistoricalService:
         
         # If no data for today, try yesterday (most recent trading day)
         if not intraday_prices and target_date == date.today():
-            recent_date = StockPrice.objects.filter(
+            recent_date = LatestPrice.objects.filter(
                 symbol=symbol.upper()
-            ).values_list('date', flat=True).order_by('-date').first()
+            ).values_list('date', flat=True).first()
             
             if recent_date:
                 target_date = recent_date
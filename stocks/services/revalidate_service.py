@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class HistoricalRevalidator:
+    """
+    Refreshes historical ranges in the background after a stale payload has
+    been served. Each (symbol, range) is queued at most once at a time.
+    """
+
+    def __init__(self, max_workers=2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='MSE-Revalidate')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, symbol, time_range):
+        """Queue a refresh; returns False if one is already queued or running"""
+        key = (symbol, time_range)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self._pool.submit(self._refresh, symbol, time_range)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _refresh(self, symbol, time_range):
+        # Goes through the shared rate-limited session and single-flight lock,
+        # and stores what it fetched before caching it
+        from stocks.services.fetch_service import historical_fetcher
+        service = historical_fetcher.service
+        try:
+            data = service.get_historical_data(symbol, time_range)
+            logger.info(f"Revalidated {symbol} {time_range}: {'ok' if data else 'no data'}")
+        except Exception as e:
+            logger.error(f"Error revalidating {symbol} {time_range}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard((symbol, time_range))
+            connection.close()
+
+
+historical_revalidator = HistoricalRevalidator(
+    max_workers=getattr(settings, 'HISTORICAL_REVALIDATE_WORKERS', 2),
+)
@@ -0,0 +1,136 @@
+import threading
+import time
+import uuid
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within one process: the
+    first caller runs the function and the others wait for its result
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, load=None):
+        """
+        Return (value, shared); shared is True when the value came from
+        another caller's run.
+
+        Args:
+            key (str): Identifies the work being coalesced
+            fn (callable): Computes the value
+            load (callable): Optionally reads an already stored value, so a
+                caller arriving just after the previous run finished reuses it
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        shared = False
+        try:
+            value = load() if load is not None else None
+            if value is None:
+                value = fn()
+            else:
+                shared = True
+            call.value = value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, shared
+
+
+class CacheSingleFlight:
+    """
+    Coalesces calls for the same key across processes with a lock held in a
+    shared cache. Callers that find the lock taken poll `load` until the
+    leader has stored its result, and run the function themselves if the
+    leader gives up or takes longer than wait_timeout.
+    """
+
+    def __init__(self, cache_alias='default', lock_timeout=60, wait_timeout=45, poll_interval=0.25):
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.local = SingleFlight()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def do(self, key, fn, load):
+        """
+        Return (value, shared).
+
+        Args:
+            key (str): Key of the result in the shared cache
+            fn (callable): Computes the result and stores it under key
+            load (callable): Reads the stored result, None while missing
+        """
+        (value, shared), waited = self.local.do(key, lambda: self._do_locked(key, fn, load))
+        return value, shared or waited
+
+    def _do_locked(self, key, fn, load):
+        lock_key = f"singleflight:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+
+        while not self.cache.add(lock_key, token, self.lock_timeout):
+            value = load()
+            if value is not None:
+                return value, True
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for another worker to fill {key}, fetching it here")
+                return fn(), False
+            time.sleep(self.poll_interval)
+
+        try:
+            # The previous leader may have finished between our miss and taking the lock
+            value = load()
+            if value is not None:
+                return value, True
+            return fn(), False
+        finally:
+            if self.cache.get(lock_key) == token:
+                self.cache.delete(lock_key)
+
+
+def _build_single_flight():
+    if getattr(settings, 'HISTORICAL_SINGLE_FLIGHT_CROSS_PROCESS', True):
+        return CacheSingleFlight(
+            cache_alias=getattr(settings, 'HISTORICAL_SINGLE_FLIGHT_CACHE', 'shared'),
+            lock_timeout=getattr(settings, 'HISTORICAL_SINGLE_FLIGHT_LOCK_TIMEOUT', 60),
+            wait_timeout=getattr(settings, 'HISTORICAL_SINGLE_FLIGHT_WAIT_TIMEOUT', 45),
+        )
+    return SingleFlight()
+
+
+historical_single_flight = _build_single_flight()
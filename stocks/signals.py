@@ -0,0 +1,11 @@
+# Signals keeping the conditional GET data-version stamps current
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Company
+from . import data_versions
+
+
+@receiver([post_save, post_delete], sender=Company)
+def touch_company_version(sender, instance, **kwargs):
+    """Company profile changes invalidate ETags of company/<symbol>/"""
+    data_versions.touch(f"company:{instance.symbol}")
@@ -1,3 +1,868 @@
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIRequestFactory
+from config.cache import TieredCache
+from config.compression import APICompressionMiddleware, negotiate_encoding
+from config.renderers import FastJSONParser, FastJSONRenderer
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+import contextlib
+import gzip
+import io
+import json
+import tempfile
+import threading
+import time as timer
 
-# Create your tests here.
+from .models import StockPrice, LatestPrice, HistoricalPrice, Company
+from .views import company_detail, historical_prices, latest_prices, prices_by_datetime
+from .services.asof_service import asof_indexes
+from .services.historical_service import FetchedPrices, MSEHistoricalService
+from .services.fetch_service import HistoricalFetcher, PoliteSession, RateLimiter
+from .services.singleflight import CacheSingleFlight, SingleFlight
+from . import cache_keys, data_versions, payload_cache
+import mse_scrapper_html
+from mse_scrapper_html import parse_mse_html, save_to_database, ticker_block_hash
+
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+
+def make_tick(symbol, price, tick_date, tick_time):
+    return StockPrice.objects.create(
+        symbol=symbol,
+        price=price,
+        change=0,
+        direction='no change',
+        date=tick_date,
+        time=tick_time,
+        market_status='Open',
+        market_update_time='',
+    )
+
+
+class LatestPricesTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        for i in range(18):
+            symbol = f"SYM{i:02d}"
+            make_tick(symbol, 1.0, date(2025, 6, 23), time(15, 0))
+            make_tick(symbol, 2.0, date(2025, 6, 24), time(9, 0))
+            make_tick(symbol, 3.0 + i, date(2025, 6, 24), time(14, 30))
+        # A symbol that stopped trading before the latest date is left out
+        make_tick('OLD', 9.0, date(2025, 6, 20), time(10, 0))
+        LatestPrice.rebuild()
+
+    def test_latest_tick_per_symbol_on_latest_date(self):
+        response = latest_prices(self.factory.get('/api/latest/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 16)
+        self.assertEqual([row['symbol'] for row in response.data], [f"SYM{i:02d}" for i in range(16)])
+        self.assertEqual(response.data[0]['price'], 3.0)
+        self.assertEqual(response.data[0]['date'], '2025-06-24')
+        self.assertEqual(response.data[0]['time'], '14:30:00')
+
+    def test_query_count(self):
+        # The tiered cache's once-a-second stamp check would otherwise land in the count at random
+        with mock.patch.object(caches['default'], 'stamp_check_interval', float('inf')):
+            latest_prices(self.factory.get('/api/latest/'))  # Reads the ETag stamp into the cache
+            with self.assertNumQueries(1):
+                latest_prices(self.factory.get('/api/latest/'))
+
+    def test_empty_table(self):
+        LatestPrice.objects.all().delete()
+        response = latest_prices(self.factory.get('/api/latest/'))
+        self.assertEqual(response.data, [])
+
+
+class LatestPriceTests(TestCase):
+    def test_update_from_tick_keeps_newest(self):
+        newer = make_tick('TNM', 20.0, date(2025, 6, 24), time(14, 30))
+        older = make_tick('TNM', 19.0, date(2025, 6, 24), time(9, 0))
+
+        self.assertTrue(LatestPrice.update_from_tick(newer))
+        self.assertFalse(LatestPrice.update_from_tick(older))
+        self.assertEqual(LatestPrice.objects.get(symbol='TNM').price, 20.0)
+
+
+class PricesByDatetimeTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        asof_indexes.invalidate()
+        make_tick('AIRTEL', 100.0, date(2025, 6, 24), time(9, 30))
+        make_tick('AIRTEL', 101.0, date(2025, 6, 24), time(11, 0))
+        make_tick('AIRTEL', 102.0, date(2025, 6, 24), time(14, 0))
+        make_tick('TNM', 20.0, date(2025, 6, 24), time(12, 30))
+
+    def get(self, **params):
+        return prices_by_datetime(self.factory.get('/api/by-datetime/', params))
+
+    def test_price_as_of_time(self):
+        response = self.get(date='2025-06-24', time='11:30:00')
+
+        self.assertEqual([(row['symbol'], row['price']) for row in response.data],
+                         [('AIRTEL', 101.0), ('TNM', 20.0)])
+
+    def test_multiple_times(self):
+        with self.assertNumQueries(1):
+            response = self.get(date='2025-06-24', times='10:00,12:00,14:30')
+
+        self.assertEqual(list(response.data), ['10:00:00', '12:00:00', '14:30:00'])
+        self.assertEqual(response.data['12:00:00'][0]['price'], 101.0)
+        self.assertEqual(response.data['14:30:00'][0]['price'], 102.0)
+
+    def test_latest_without_time(self):
+        response = self.get(date='2025-06-24', symbol='AIRTEL')
+
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['price'], 102.0)
+
+    def test_invalid_time(self):
+        self.assertEqual(self.get(date='2025-06-24', time='noon').status_code, 400)
+
+
+class HistoricalUpsertTests(TestCase):
+    def series(self, *points):
+        return {'stock_prices': [
+            {'date': point_date, 'price': price, 'close': price}
+            for point_date, price in points
+        ]}
+
+    def test_counts_inserted_and_updated(self):
+        service = MSEHistoricalService()
+        first = service.upsert_historical_prices('TNM', self.series(('2025-06-23', 20.0), ('2025-06-24', 21.0)))
+        second = service.upsert_historical_prices('TNM', self.series(('2025-06-24', 22.0), ('2025-06-25', 23.0)))
+
+        self.assertEqual(first, {'inserted': 2, 'updated': 0})
+        self.assertEqual(second, {'inserted': 1, 'updated': 1})
+        self.assertEqual(HistoricalPrice.objects.get(symbol='TNM', date=date(2025, 6, 24)).price, 22)
+
+    def test_save_to_database_returns_new_rows(self):
+        service = MSEHistoricalService()
+        data = self.series(('2025-06-23', 20.0), ('2025-06-24', 21.0))
+
+        self.assertEqual(service.save_to_database('TNM', data), 2)
+        self.assertEqual(service.save_to_database('TNM', data), 0)
+
+
+class IncrementalHistoricalFetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = MSEHistoricalService()
+        today = date.today()
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(symbol='TNM', date=today - timedelta(days=offset), price=20, close_price=20)
+            for offset in range(5, 1830)
+        ])
+
+    def test_fetches_only_the_missing_window(self):
+        delta = [{'date': date.today().isoformat(), 'price': 25.0, 'close': 25.0}]
+        with mock.patch.object(self.service, '_fetch_chart_data', return_value=delta) as fetch:
+            result = self.service.get_historical_data('TNM', '5years')
+
+        fetch.assert_called_once_with('TNM', '1month')
+        self.assertEqual(result['source'], 'incremental')
+        self.assertEqual(result['stock_prices'][-1], {
+            'date': date.today().isoformat(), 'price': 25.0, 'close': 25.0,
+            'open': None, 'high': None, 'low': None, 'volume': None, 'turnover': None,
+        })
+
+    def test_full_fetch_when_database_does_not_cover_range(self):
+        HistoricalPrice.objects.filter(date__lt=date.today() - timedelta(days=400)).delete()
+        with mock.patch.object(self.service, '_fetch_chart_data', return_value=[]) as fetch:
+            self.service.get_historical_data('TNM', '5years')
+
+        fetch.assert_called_once_with('TNM', '5years')
+
+    def test_entries_cached_after_new_dates_stay_reachable(self):
+        delta = [{'date': date.today().isoformat(), 'price': 25.0, 'close': 25.0}]
+        with mock.patch.object(self.service, '_fetch_chart_data', return_value=delta):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.service.get_historical_data('TNM', '1month')
+        fresh = cache.get(self.service.historical_cache_key('TNM', '1month'))
+
+        self.assertEqual(fresh['stock_prices'][-1]['date'], date.today().isoformat())
+        self.assertEqual(cache.get(self.service.stale_cache_key('TNM', '1month')), fresh)
+        with mock.patch.object(self.service, '_fetch_chart_data') as fetch:
+            self.assertEqual(self.service.get_historical_data('TNM', '1month')['source'], 'cache')
+        fetch.assert_not_called()
+
+    def test_new_dates_expire_other_ranges_but_not_their_stale_copies(self):
+        with mock.patch.object(self.service, '_fetch_chart_data', return_value=[]):
+            year = self.service.get_historical_data('TNM', '1year')
+        delta = [{'date': date.today().isoformat(), 'price': 25.0, 'close': 25.0}]
+        with mock.patch.object(self.service, '_fetch_chart_data', return_value=delta):
+            self.service.get_historical_data('TNM', '1month')
+
+        self.assertIsNone(cache.get(self.service.historical_cache_key('TNM', '1year')))
+        self.assertEqual(cache.get(self.service.stale_cache_key('TNM', '1year')), year)
+
+
+class ScraperParseTests(TestCase):
+    def parse(self, content):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return parse_mse_html(content, scraped_at=datetime(2025, 6, 24, 14, 45, 30))
+
+    def test_parses_ticker_from_saved_homepage(self):
+        records = self.parse((FIXTURES_DIR / 'mse_homepage.html').read_bytes())
+
+        # The ticker repeats for the marquee; only the first 16 items are kept
+        self.assertEqual(len(records), 16)
+        self.assertEqual(records[0], {
+            'Symbol': 'AIRTEL', 'Price': 118.5, 'Change': 0.5, 'Direction': 'up',
+            'Date': '2025-06-24', 'Time': '14:45:30',
+            'Market_Status': 'Open', 'Market_Update_Time': '24/06/2025 14:45:02',
+        })
+        by_symbol = {record['Symbol']: record for record in records}
+        self.assertEqual(by_symbol['NBM']['Price'], 6499.99)
+        self.assertEqual((by_symbol['FDHB']['Change'], by_symbol['FDHB']['Direction']), (-4.98, 'down'))
+        self.assertEqual(by_symbol['BHL']['Direction'], 'no change')
+
+    def test_skips_items_without_a_price(self):
+        records = self.parse(
+            '<div class="time"><small><span>Market Status: Closed</span></small></div>'
+            '<div class="ticker__item"><span>TNM</span><span class="pricedata">-</span>'
+            '<span class="changedata">(0.00)</span></div>'
+            '<div class="ticker__item"><span>NBM</span><span class="pricedata changedown">6,400.00</span>'
+            '<span class="changedata">(-99.99)</span></div>'
+        )
+
+        self.assertEqual([(r['Symbol'], r['Price'], r['Change']) for r in records], [('NBM', 6400.0, -99.99)])
+        self.assertEqual(records[0]['Market_Status'], 'Unknown')
+
+
+class ScraperChangeDetectionTests(TestCase):
+    def setUp(self):
+        self.html = (FIXTURES_DIR / 'mse_homepage.html').read_bytes()
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        patcher = mock.patch.object(mse_scrapper_html, 'PAGE_STATE_FILE', str(Path(state_dir.name) / 'state.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def records(self, scraped_at):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return parse_mse_html(self.html, scraped_at=scraped_at)
+
+    def save(self, records):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return save_to_database(records)
+
+    def fetch(self, status_code=200, headers=None, saved=True):
+        response = mock.Mock(status_code=status_code, content=self.html, headers=headers or {})
+        with mock.patch.object(mse_scrapper_html.requests, 'get', return_value=response) as get, \
+                contextlib.redirect_stdout(io.StringIO()):
+            records, page_state = mse_scrapper_html.extract_mse_data_html(force_scrape=True, with_page_state=True)
+        if saved and page_state:
+            mse_scrapper_html.save_page_state(page_state)
+        return records, get.call_args.kwargs['headers']
+
+    def test_only_changed_ticks_are_stored(self):
+        self.assertEqual(self.save(self.records(datetime(2025, 6, 24, 10, 0)))['saved'], 16)
+
+        records = self.records(datetime(2025, 6, 24, 10, 5))
+        records[0]['Price'] += 1
+        stats = self.save(records)
+
+        self.assertEqual((stats['saved'], stats['unchanged']), (1, 15))
+        self.assertEqual(StockPrice.objects.count(), 17)
+        self.assertEqual(LatestPrice.objects.get(symbol='AIRTEL').time, time(10, 5))
+
+    def test_first_scrape_of_the_day_stores_every_tick(self):
+        self.save(self.records(datetime(2025, 6, 24, 16, 0)))
+
+        self.assertEqual(self.save(self.records(datetime(2025, 6, 25, 9, 0)))['saved'], 16)
+
+    def test_ticker_hash_ignores_markup_outside_the_ticker(self):
+        changed_news = self.html.replace(b'Market announcement 1:', b'Market announcement one:')
+        changed_price = self.html.replace(b'118.50', b'119.00')
+
+        self.assertEqual(ticker_block_hash(changed_news), ticker_block_hash(self.html))
+        self.assertNotEqual(ticker_block_hash(changed_price), ticker_block_hash(self.html))
+
+    def test_unchanged_page_skips_the_parse(self):
+        records, headers = self.fetch(headers={'ETag': '"v1"'})
+        self.assertEqual(len(records), 16)
+        self.assertNotIn('If-None-Match', headers)
+
+        with mock.patch.object(mse_scrapper_html, 'parse_mse_html') as parse:
+            self.assertEqual(self.fetch(status_code=304)[0], [])
+            self.assertEqual(self.fetch()[0], [])
+        parse.assert_not_called()
+        self.assertEqual(self.fetch(status_code=304)[1]['If-None-Match'], '"v1"')
+
+    def test_page_state_waits_for_the_save(self):
+        self.assertEqual(len(self.fetch(headers={'ETag': '"v1"'}, saved=False)[0]), 16)
+
+        records, headers = self.fetch(headers={'ETag': '"v1"'})
+        self.assertEqual(len(records), 16)
+        self.assertNotIn('If-None-Match', headers)
+
+    def test_failed_save_is_reported(self):
+        with mock.patch.object(StockPrice.objects, 'bulk_create', side_effect=DatabaseError('locked')):
+            stats = self.save(self.records(datetime(2025, 6, 24, 10, 0)))
+
+        self.assertEqual((stats['saved'], stats['error']), (0, 'locked'))
+
+
+class HistoricalFetcherTests(TestCase):
+    def response(self, status_code, headers=None):
+        return mock.Mock(status_code=status_code, headers=headers or {})
+
+    def test_retries_server_errors_with_backoff(self):
+        session = PoliteSession(requests_per_second=0, per_host_concurrency=2, max_retries=3, backoff=1.0, backoff_max=30.0)
+        responses = [self.response(503), self.response(429, {'Retry-After': '7'}), self.response(200)]
+        with mock.patch('requests.Session.request', side_effect=responses) as send, \
+                mock.patch('stocks.services.fetch_service.time.sleep') as sleep:
+            response = session.post('https://mse.co.mw/company/X/1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.call_count, 3)
+        first_delay, second_delay = [call.args[0] for call in sleep.call_args_list]
+        self.assertLessEqual(first_delay, 1.0)
+        self.assertEqual(second_delay, 7.0)
+
+    def test_gives_up_after_max_retries(self):
+        session = PoliteSession(requests_per_second=0, per_host_concurrency=2, max_retries=2, backoff=1.0, backoff_max=30.0)
+        with mock.patch('requests.Session.request', return_value=self.response(502)) as send, \
+                mock.patch('stocks.services.fetch_service.time.sleep'):
+            self.assertEqual(session.get('https://mse.co.mw/').status_code, 502)
+        self.assertEqual(send.call_count, 3)
+
+    def test_rate_limiter_spaces_calls(self):
+        limiter = RateLimiter(50)
+        started = timer.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(timer.monotonic() - started, 0.1)
+
+    def test_fetch_many_returns_results_in_input_order(self):
+        fetcher = HistoricalFetcher(max_workers=4)
+        point = {'date': date.today().isoformat(), 'price': 20.0, 'close': 20.0}
+
+        def fetch(symbol, time_range, incremental=None):
+            if symbol == 'BAD':
+                raise ValueError('boom')
+            return FetchedPrices('delta', [point], '1month') if time_range == '5years' else FetchedPrices('full', [point], None)
+
+        writer_threads = set()
+        upsert = fetcher.service.upsert_historical_prices
+
+        def record_writer(*args, **kwargs):
+            writer_threads.add(threading.current_thread())
+            return upsert(*args, **kwargs)
+
+        # Pool threads only touch the cache; keep it off the test database
+        local_cache = LocMemCache('fetcher-test', {})
+        local_cache.clear()
+        with mock.patch('stocks.services.historical_service.cache', local_cache), \
+                mock.patch('stocks.cache_keys.cache', local_cache), \
+                mock.patch.object(fetcher.service, 'fetch_remote', side_effect=fetch), \
+                mock.patch.object(fetcher.service, '_get_company_name', side_effect=lambda symbol: symbol), \
+                mock.patch.object(fetcher.service, 'upsert_historical_prices', side_effect=record_writer):
+            results = fetcher.fetch_many(['TNM', 'NBM', 'BAD'], ['1month', '5years'], save=True)
+
+        self.assertEqual(
+            [(r.symbol, r.time_range, r.saved, r.error) for r in results],
+            [('TNM', '1month', 1, None), ('TNM', '5years', 0, None),
+             ('NBM', '1month', 1, None), ('NBM', '5years', 0, None),
+             ('BAD', '1month', 0, 'boom'), ('BAD', '5years', 0, 'boom')],
+        )
+        self.assertEqual([r.data['source'] for r in results[:4]], ['mse.co.mw', 'incremental'] * 2)
+        self.assertEqual(writer_threads, {threading.current_thread()})
+
+    def test_fetch_command_fetches_every_historical_range(self):
+        Company.objects.create(symbol='TNM', name='TNM plc')
+        with mock.patch('stocks.services.fetch_service.historical_fetcher.fetch_many', return_value=[]) as fetch_many:
+            call_command('fetch_historical_data', '--range', 'all', stdout=io.StringIO())
+
+        fetch_many.assert_called_once_with(['TNM'], ['1month', '3months', '6months', '1year', '2years', '5years'], save=True)
+
+    def test_delta_rows_are_counted_as_saved(self):
+        fetcher = HistoricalFetcher(max_workers=2)
+        HistoricalPrice.objects.create(symbol='TNM', date=date.today() - timedelta(days=3), price=20, close_price=20)
+        delta = FetchedPrices('delta', [{'date': date.today().isoformat(), 'price': 21.0, 'close': 21.0}], '1month')
+
+        local_cache = LocMemCache('fetcher-test', {})
+        local_cache.clear()
+        with mock.patch('stocks.services.historical_service.cache', local_cache), \
+                mock.patch('stocks.cache_keys.cache', local_cache), \
+                mock.patch.object(fetcher.service, 'fetch_remote', return_value=delta):
+            [result] = fetcher.fetch_many(['TNM'], ['1month'], save=True)
+
+        self.assertEqual((result.saved, result.error, result.data['data_points']), (1, None, 2))
+
+
+class SingleFlightTests(TestCase):
+    def run_concurrently(self, target, count):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return 'value'
+
+        timer_thread = threading.Timer(0.2, release.set)
+        timer_thread.start()
+        results = self.run_concurrently(lambda: flight.do('key', work), 5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('value', False)] + [('value', True)] * 4)
+
+    # The lock tests use a process-local cache so the "other worker" thread
+    # does not contend with the test transaction on SQLite
+    def shared_cache(self):
+        shared = caches['ratelimit']
+        shared.clear()
+        return shared
+
+    def test_waits_for_another_process_to_fill_the_cache(self):
+        shared = self.shared_cache()
+        flight = CacheSingleFlight(cache_alias='ratelimit', lock_timeout=10, wait_timeout=5, poll_interval=0.01)
+        shared.add('singleflight:key', 'other-worker', 10)
+        threading.Timer(0.1, lambda: shared.set('key', 'from other worker')).start()
+        fn = mock.Mock()
+
+        self.assertEqual(flight.do('key', fn, lambda: shared.get('key')), ('from other worker', True))
+        fn.assert_not_called()
+
+    def test_fetches_itself_when_the_lock_holder_is_too_slow(self):
+        shared = self.shared_cache()
+        flight = CacheSingleFlight(cache_alias='ratelimit', lock_timeout=10, wait_timeout=0.05, poll_interval=0.01)
+        shared.add('singleflight:key', 'other-worker', 10)
+
+        self.assertEqual(flight.do('key', lambda: 'mine', lambda: shared.get('key')), ('mine', False))
+        self.assertEqual(shared.get('singleflight:key'), 'other-worker')
+
+    def test_service_coalesces_concurrent_misses(self):
+        service = MSEHistoricalService()
+        release = threading.Event()
+        threading.Timer(0.2, release.set).start()
+
+        def slow_fetch(symbol, time_range):
+            release.wait(5)
+            return [{'date': '2025-06-24', 'price': 20.0, 'close': 20.0}]
+
+        local_cache = LocMemCache('singleflight-test', {})
+        local_cache.clear()
+        with mock.patch('stocks.services.historical_service.cache', local_cache), \
+                mock.patch('stocks.cache_keys.cache', local_cache), \
+                mock.patch('stocks.services.historical_service.historical_single_flight', SingleFlight()), \
+                mock.patch.object(service, '_get_company_name', return_value='TNM'), \
+                mock.patch.object(service, '_fetch_chart_data', side_effect=slow_fetch) as fetch, \
+                mock.patch.object(service, 'upsert_historical_prices', return_value={'inserted': 0, 'updated': 1}) as store:
+            results = self.run_concurrently(lambda: service.get_historical_data('TNM', '1month', incremental=False), 4)
+
+        fetch.assert_called_once()
+        store.assert_called_once()
+        self.assertEqual(sorted(r['source'] for r in results), ['cache', 'cache', 'cache', 'mse.co.mw'])
+
+
+@mock.patch('stocks.views.historical_revalidator')
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        today = date.today()
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(symbol='TNM', date=today - timedelta(days=offset), price=20, close_price=20)
+            for offset in range(1, 25)
+        ])
+
+    def get(self, **params):
+        return historical_prices(self.factory.get('/api/historical/TNM/', {'range': '1month', **params}), 'TNM')
+
+    def test_serves_stale_payload_and_refreshes_in_background(self, revalidator):
+        retrieved_at = (datetime.now() - timedelta(hours=7)).isoformat()
+        cache.set(MSEHistoricalService.stale_cache_key('TNM', '1month'), {'stock_prices': [], 'retrieved_at': retrieved_at})
+
+        with mock.patch.object(MSEHistoricalService, 'get_historical_data') as fetch:
+            response = self.get()
+
+        fetch.assert_not_called()
+        revalidator.submit.assert_called_once_with('TNM', '1month')
+        self.assertEqual(response['X-Data-Source'], 'stale')
+        self.assertAlmostEqual(int(response['Age']), 7 * 3600, delta=5)
+
+    def test_serves_stored_prices_as_stale(self, revalidator):
+        response = self.get()
+
+        revalidator.submit.assert_called_once_with('TNM', '1month')
+        self.assertEqual((response['X-Data-Source'], json.loads(response.content)['data_points']), ('stale', 24))
+        self.assertLess(int(response['Age']), 5)
+
+    def test_blocks_on_fetch_past_the_hard_ttl(self, revalidator):
+        HistoricalPrice.objects.update(last_updated=timezone.now() - timedelta(days=3))
+        fresh = {'stock_prices': [], 'source': 'incremental', 'retrieved_at': datetime.now().isoformat()}
+
+        with mock.patch.object(MSEHistoricalService, 'get_historical_data', return_value=fresh):
+            response = self.get()
+        # Same body shape as cache hits: the source is only in the header
+        self.assertEqual(response['X-Data-Source'], 'incremental')
+        self.assertNotIn('source', json.loads(response.content))
+        with mock.patch.object(MSEHistoricalService, 'get_historical_data', return_value=None):
+            response = self.get()
+
+        revalidator.submit.assert_not_called()
+        self.assertEqual(response['X-Data-Source'], 'stale')
+        self.assertGreater(int(response['Age']), 2 * 86400)
+
+
+class RenderedPayloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.key = MSEHistoricalService().historical_cache_key('TNM', '1month')
+        cache.set(self.key, {
+            'stock_prices': [{'date': '2025-06-24', 'close': 20.0}],
+            'source': 'incremental',
+            'retrieved_at': datetime.now().isoformat(),
+        })
+
+    def get(self):
+        return historical_prices(self.factory.get('/api/historical/TNM/', {'range': '1month'}), 'TNM')
+
+    def test_hits_skip_the_renderer(self):
+        first = self.get()
+        with mock.patch('rest_framework.renderers.JSONRenderer.render') as render:
+            second = self.get()
+
+        render.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(json.loads(second.content), {'stock_prices': [{'date': '2025-06-24', 'close': 20.0}],
+                                                      'retrieved_at': cache.get(self.key)['retrieved_at']})
+        self.assertEqual(second['X-Data-Source'], 'cache')
+        self.assertEqual(second['X-Retrieved-At'], cache.get(self.key)['retrieved_at'])
+
+    def test_new_data_version_renders_again(self):
+        self.get()
+        cache.set(self.key, {'stock_prices': [], 'source': 'incremental'})
+        data_versions.touch('historical:TNM', timezone.now() + timedelta(seconds=1))
+
+        self.assertEqual(json.loads(self.get().content), {'stock_prices': []})
+
+
+class ColumnarHistoricalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        today = date.today()
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(symbol='TNM', date=today - timedelta(days=offset), price=20 + offset,
+                            close_price=20 + offset, volume=100 * offset if offset % 2 else None)
+            for offset in (3, 2, 1)
+        ])
+        # A fresh row-format entry means the stored prices are current
+        cache.set(MSEHistoricalService().historical_cache_key('TNM', '1month'), {'stock_prices': []})
+
+    def get(self, **params):
+        request = self.factory.get('/api/historical/TNM/', {'range': '1month', 'format': 'columnar', **params})
+        return historical_prices(request, 'TNM')
+
+    def test_parallel_arrays_without_empty_columns(self):
+        response = self.get()
+        data = json.loads(response.content)
+
+        self.assertEqual(response['X-Data-Source'], 'cache')
+        self.assertEqual(data['dates'], [(date.today() - timedelta(days=offset)).isoformat() for offset in (3, 2, 1)])
+        self.assertEqual(data['close'], [23.0, 22.0, 21.0])
+        self.assertEqual(data['volume'], [300, None, 100])
+        self.assertEqual(data['data_points'], 3)
+        self.assertFalse({'open', 'high', 'low', 'turnover', 'stock_prices'} & set(data))
+
+    def test_served_pre_rendered_after_the_first_request(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual(second.content, first.content)
+        self.assertNotEqual(first['ETag'], historical_prices(
+            self.factory.get('/api/historical/TNM/', {'range': '1month'}), 'TNM')['ETag'])
+
+    @mock.patch('stocks.views.historical_revalidator')
+    def test_stale_rows_refresh_in_background(self, revalidator):
+        cache.clear()
+        response = self.get()
+
+        revalidator.submit.assert_called_once_with('TNM', '1month')
+        self.assertEqual((response['X-Data-Source'], json.loads(response.content)['data_points']), ('stale', 3))
+
+    @mock.patch('stocks.views.historical_revalidator')
+    @mock.patch.object(MSEHistoricalService, 'get_historical_data', return_value={'source': 'mse.co.mw'})
+    def test_rows_past_the_hard_ttl_block_on_a_fetch(self, get_historical_data, revalidator):
+        cache.clear()
+        HistoricalPrice.objects.update(last_updated=timezone.now() - timedelta(days=90))
+        response = self.get()
+
+        get_historical_data.assert_called_once_with('TNM', '1month')
+        revalidator.submit.assert_not_called()
+        self.assertEqual(response['X-Data-Source'], 'mse.co.mw')
+        self.assertNotIn('Age', response)
+
+        # Older data beats none when MSE is unreachable
+        get_historical_data.return_value = None
+        cache.clear()
+        response = self.get()
+        self.assertEqual(response['X-Data-Source'], 'stale')
+        self.assertGreater(int(response['Age']), 89 * 86400)
+
+    def test_intraday_is_rejected(self):
+        self.assertEqual(self.get(range='1day').status_code, 400)
+
+
+class FastJSONRendererTests(TestCase):
+    def test_output_matches_drf_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+        payload = {
+            'date': date(2025, 6, 24),
+            'time': time(14, 30, 5),
+            'close': Decimal('380.02'),
+            'utc': datetime(2025, 6, 24, 12, 30, 0, 123456, tzinfo=dt_timezone.utc),
+            'local': timezone.localtime(datetime(2025, 6, 24, 12, 30, tzinfo=dt_timezone.utc)),
+            'naive': datetime(2025, 6, 24, 14, 30),
+            'text': 'Malawi \u2028 Stock Exchange',
+            'values': StockPrice.objects.none(),
+            1: None,
+        }
+
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(FastJSONRenderer().render(payload, 'application/json; indent=2'),
+                         JSONRenderer().render(payload, 'application/json; indent=2'))
+
+    def test_parser_round_trip(self):
+        data = {'symbols': ['TNM', 'NBM'], 'price': 20.5}
+
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(FastJSONRenderer().render(data))), data)
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"symbols": [NaN]}'))
+
+
+class APICompressionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.middleware = APICompressionMiddleware(lambda request: None)
+        self.body = json.dumps([{'symbol': 'TNM', 'close': 20.0 + i} for i in range(200)]).encode()
+
+    def respond(self, response, path='/api/latest/', accept_encoding='gzip, deflate'):
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware.process_response(request, response)
+
+    def test_large_api_responses_are_gzipped(self):
+        response = self.respond(HttpResponse(self.body, content_type='application/json'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_small_image_and_unaccepted_responses_are_left_alone(self):
+        self.assertFalse(self.respond(HttpResponse(b'{"status": "Open"}')).has_header('Content-Encoding'))
+        self.assertFalse(self.respond(HttpResponse(self.body, content_type='image/png'), '/api/stock-icon/TNM/')
+                         .has_header('Content-Encoding'))
+        self.assertFalse(self.respond(HttpResponse(self.body), '/dashboard/').has_header('Content-Encoding'))
+        self.assertFalse(self.respond(HttpResponse(self.body), accept_encoding='identity').has_header('Content-Encoding'))
+
+    def test_pre_rendered_payloads_are_compressed_once(self):
+        payload = payload_cache.render({'stock_prices': json.loads(self.body)}, FastJSONRenderer())
+        with mock.patch('config.compression.gzip.compress', wraps=gzip.compress) as compress:
+            first = self.respond(payload_cache.response(payload, 'cache', 'application/json'))
+            second = self.respond(payload_cache.response(payload, 'cache', 'application/json'))
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(gzip.decompress(second.content), payload.body)
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate_encoding('deflate, gzip;q=0.5'), 'gzip')
+        self.assertEqual(negotiate_encoding('*'), negotiate_encoding('br, gzip'))
+        self.assertIsNone(negotiate_encoding('gzip;q=0'))
+        self.assertIsNone(negotiate_encoding(''))
+
+
+class TieredCacheTests(TestCase):
+    def make_cache(self, **options):
+        # Two instances over one L2 stand in for two worker processes
+        return TieredCache('', {'OPTIONS': {'L2': 'ratelimit', 'STAMP_CHECK_INTERVAL': 0, **options}})
+
+    def setUp(self):
+        caches['ratelimit'].clear()
+
+    def test_reads_are_served_from_l1_after_the_first(self):
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set('key', {'points': [1, 2]})
+
+        self.assertEqual(reader.get('key'), {'points': [1, 2]})
+        reader.get('key')['points'].append(3)  # Callers get copies, as with LocMemCache
+        self.assertEqual(reader.get('key'), {'points': [1, 2]})
+        self.assertIsNone(reader.get('missing'))
+
+        stats = reader.stats()
+        self.assertEqual((stats['l1_hits'], stats['l2_hits'], stats['l2_misses']), (2, 1, 1))
+        self.assertEqual(stats['overall_hit_ratio'], 0.75)
+
+    def test_writes_in_another_process_invalidate_l1(self):
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set('key', 'old')
+        self.assertEqual(reader.get('key'), 'old')
+
+        writer.set('key', 'new')
+        self.assertEqual(reader.get('key'), 'new')
+        writer.delete('key')
+        self.assertIsNone(reader.get('key'))
+
+    def test_unrelated_writes_keep_other_namespaces_in_l1(self):
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set('historical:TNM:1month', 'prices')
+        self.assertEqual(reader.get('historical:TNM:1month'), 'prices')
+
+        writer.set('dataver:ticks', 1)
+        writer.set('dataver:ticks', 2)  # Overwrite: stamps the 'dataver' namespace only
+        writer.set('gen:historical:NBM', 3)
+        writer.delete('gen:historical:NBM')
+        self.assertEqual(reader.get('historical:TNM:1month'), 'prices')
+        self.assertEqual(reader.stats()['l1_hits'], 1)
+
+    def test_rewrite_after_l2_expiry_invalidates_l1(self):
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set('dataver:ticks', 'old')
+        self.assertEqual(reader.get('dataver:ticks'), 'old')
+
+        caches['ratelimit'].delete('dataver:ticks')  # Expired from L2, still in the reader's L1
+        writer.set('dataver:ticks', 'new')
+        self.assertEqual(reader.get('dataver:ticks'), 'new')
+
+    def test_stamp_is_only_rechecked_after_the_interval(self):
+        writer, reader = self.make_cache(), self.make_cache(STAMP_CHECK_INTERVAL=60)
+        writer.set('key', 'old')
+        self.assertEqual(reader.get('key'), 'old')
+
+        writer.set('key', 'new')
+        self.assertEqual(reader.get('key'), 'old')
+
+    def test_l1_is_bounded(self):
+        tiered = self.make_cache(L1_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            tiered.set(key, key)
+
+        self.assertEqual(tiered.stats()['l1_entries'], 2)
+        self.assertEqual(tiered.get('a'), 'a')  # Evicted from L1, still in L2
+        self.assertEqual(tiered.stats()['l2_hits'], 1)
+
+
+class CacheKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_symbol_invalidation_leaves_other_symbols_alone(self):
+        tnm, nbm = cache_keys.versioned_key('historical', 'TNM', '1month'), cache_keys.versioned_key('historical', 'NBM', '1month')
+        self.assertTrue(tnm.startswith('historical:TNM:'))
+
+        cache_keys.invalidate('historical', 'TNM')
+
+        self.assertNotEqual(cache_keys.versioned_key('historical', 'TNM', '1month'), tnm)
+        self.assertEqual(cache_keys.versioned_key('historical', 'NBM', '1month'), nbm)
+
+    def test_namespace_invalidation_covers_every_symbol(self):
+        intraday = cache_keys.versioned_key('intraday', 'TNM', '2025-06-24', 10)
+        historical = cache_keys.versioned_key('historical', 'TNM', '1month')
+
+        cache_keys.invalidate('intraday')
+
+        self.assertNotEqual(cache_keys.versioned_key('intraday', 'TNM', '2025-06-24', 10), intraday)
+        self.assertEqual(cache_keys.versioned_key('historical', 'TNM', '1month'), historical)
+
+    def test_backfill_with_new_dates_invalidates_the_symbol(self):
+        service = MSEHistoricalService()
+        key = service.historical_cache_key('TNM', '1month')
+        data = {'stock_prices': [{'date': '2025-06-24', 'price': 20.0, 'close': 20.0}]}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            service.save_to_database('TNM', data)
+        self.assertNotEqual(service.historical_cache_key('TNM', '1month'), key)
+
+        key = service.historical_cache_key('TNM', '1month')
+        with self.captureOnCommitCallbacks(execute=True):
+            service.save_to_database('TNM', data)
+        self.assertEqual(service.historical_cache_key('TNM', '1month'), key)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        make_tick('TNM', 20.0, date(2025, 6, 24), time(14, 30))
+        LatestPrice.rebuild()
+        HistoricalPrice.objects.create(symbol='TNM', date=date(2025, 6, 24), price=20.0, close_price=20.0)
+        Company.objects.create(symbol='TNM', name='TNM plc')
+
+    def revalidate(self, view, path, response, *args, **params):
+        request = self.factory.get(path, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        return view(request, *args)
+
+    def test_latest_not_modified_until_next_scrape(self):
+        response = latest_prices(self.factory.get('/api/latest/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(latest_prices, '/api/latest/', response).status_code, 304)
+
+        data_versions.touch('ticks', timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.revalidate(latest_prices, '/api/latest/', response).status_code, 200)
+
+    @mock.patch.object(MSEHistoricalService, 'get_historical_data', return_value={'stock_prices': [], 'source': 'cache'})
+    def test_historical_etag_follows_symbol_stamp(self, get_historical_data):
+        path = '/api/historical/TNM/'
+        response = historical_prices(self.factory.get(path, {'range': '1month'}), 'TNM')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.revalidate(historical_prices, path, response, 'TNM', range='1month').status_code, 304)
+        # Other ranges and refreshes are validated separately
+        self.assertNotEqual(self.revalidate(historical_prices, path, response, 'TNM', range='1year').status_code, 304)
+        self.assertNotIn('ETag', historical_prices(self.factory.get(path, {'refresh': 'true'}), 'TNM'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MSEHistoricalService().save_to_database('TNM', {'stock_prices': [{'date': '2025-06-25', 'price': 21.0, 'close': 21.0}]})
+        self.assertEqual(self.revalidate(historical_prices, path, response, 'TNM', range='1month').status_code, 200)
+
+    @mock.patch.object(MSEHistoricalService, 'get_historical_data', return_value={'stock_prices': [], 'source': 'cache'})
+    def test_not_modified_past_the_soft_ttl_queues_a_refresh(self, get_historical_data):
+        path = '/api/historical/TNM/'
+        with mock.patch('stocks.views.historical_revalidator.submit') as submit:
+            response = historical_prices(self.factory.get(path, {'range': '1month'}), 'TNM')
+            submit.reset_mock()
+            cache.set(MSEHistoricalService.historical_cache_key('TNM', '1month'), {'stock_prices': []})
+            self.assertEqual(self.revalidate(historical_prices, path, response, 'TNM', range='1month').status_code, 304)
+            submit.assert_not_called()
+
+            cache.delete(MSEHistoricalService.historical_cache_key('TNM', '1month'))
+            self.assertEqual(self.revalidate(historical_prices, path, response, 'TNM', range='1month').status_code, 304)
+        submit.assert_called_once_with('TNM', '1month')
+
+    def test_company_etag_changes_with_profile(self):
+        response = company_detail(self.factory.get('/api/company/TNM/'), 'TNM')
+        self.assertEqual(self.revalidate(company_detail, '/api/company/TNM/', response, 'TNM').status_code, 304)
+
+        company = Company.objects.get(symbol='TNM')
+        company.name = 'Telekom Networks Malawi plc'
+        company.save()
+        self.assertEqual(self.revalidate(company_detail, '/api/company/TNM/', response, 'TNM').status_code, 200)
@@ -1,19 +1,31 @@
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from django.db.models import Max
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from django.db.models import Subquery
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse, Http404
 from django.conf import settings
 from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views.decorators.http import condition
+import hashlib
+import json
 import os
-from .models import StockPrice, Company, HistoricalPrice, Subscriber
+from config.renderers import ColumnarJSONRenderer
+from .models import StockPrice, LatestPrice, Company, HistoricalPrice, Subscriber
 from .serializers import StockPriceSerializer, CompanySerializer, SubscriberSerializer
 from datetime import datetime, timedelta, date
 import logging
 
 from .services.historical_service import MSEHistoricalService
+from .services.asof_service import asof_indexes
+from .services.revalidate_service import historical_revalidator
+from .cache_keys import versioned_key
+from . import data_versions, payload_cache
 
 logger = logging.getLogger(__name__)
 
@@ -132,38 +144,38 @@ class StockPriceViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['symbol']
     ordering_fields = ['date', 'time', 'price', 'change']
 
+def _etag(*parts):
+    """Weak ETag over the data-version stamps and parameters a response depends on"""
+    return 'W/"%s"' % hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+def _ticks_last_modified(request, *args, **kwargs):
+    return data_versions.ticks_version()
+
+def _latest_prices_etag(request):
+    return _etag('latest', data_versions.ticks_version())
+
 @api_view(['GET'])
+@condition(etag_func=_latest_prices_etag, last_modified_func=_ticks_last_modified)
 def latest_prices(request):
     """
     Get the latest price for each stock symbol (limited to 16 symbols)
     """
-    # Get the latest date
-    latest_date = StockPrice.objects.aggregate(Max('date'))['date__max']
-    
-    if not latest_date:
-        return Response([])
-    
-    # Get unique symbols from the latest date, limited to 16
-    symbols = list(StockPrice.objects.filter(date=latest_date).values_list('symbol', flat=True).distinct()[:16])
-    
-    # For each symbol, get the latest record on that date
-    latest_prices = []
-    for symbol in symbols:
-        latest = StockPrice.objects.filter(
-            symbol=symbol, 
-            date=latest_date
-        ).order_by('-time').first()
-        
-        if latest:
-            latest_prices.append(latest)
-    
-    # Sort by symbol for consistent ordering and ensure we don't exceed 16
-    latest_prices.sort(key=lambda x: x.symbol)
-    latest_prices = latest_prices[:16]  # Extra safety to ensure max 16 records
+    # One query over the per-symbol snapshot: symbols whose newest tick is on the latest date
+    latest_date = LatestPrice.objects.order_by('-date').values('date')[:1]
+    latest_prices = LatestPrice.objects.filter(date=Subquery(latest_date)).order_by('symbol')[:16]
     
     serializer = StockPriceSerializer(latest_prices, many=True)
     return Response(serializer.data)
 
+def _parse_query_time(time_str):
+    """Parse HH:MM:SS or HH:MM"""
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            return datetime.strptime(time_str.strip(), fmt).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time '{time_str}'")
+
 @api_view(['GET'])
 def prices_by_datetime(request):
     """
@@ -172,14 +184,18 @@ def prices_by_datetime(request):
     Query parameters:
     - date: Date in YYYY-MM-DD format
     - time: Time in HH:MM:SS format (optional)
+    - times: Comma-separated times, e.g. 10:00,12:00,14:30 (optional); returns
+      one snapshot per time keyed by HH:MM:SS
     - symbol: Stock symbol (optional)
     - latest_only: If 'true', return only the latest price for each symbol (default: true)
+    
+    For each symbol the price is the last tick at or before the requested
+    time, or the day's first tick if it traded only later.
     """
     date_str = request.query_params.get('date')
     time_str = request.query_params.get('time')
+    times_str = request.query_params.get('times')
     symbol = request.query_params.get('symbol')
-    # By default, return only the latest price for each symbol
-    latest_only = request.query_params.get('latest_only', 'true').lower() == 'true'
     
     if not date_str:
         return Response(
@@ -188,78 +204,42 @@ def prices_by_datetime(request):
         )
     
     try:
-        # Validate date format
         query_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return Response(
+            {"error": "Invalid date format. Use YYYY-MM-DD"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        query_times = [_parse_query_time(t) for t in times_str.split(',') if t.strip()] if times_str else []
+        query_time = _parse_query_time(time_str) if time_str else None
+    except ValueError:
+        return Response(
+            {"error": "Invalid time format. Use HH:MM:SS"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        # All ticks of the day, loaded once and searched in memory
+        index = asof_indexes.get(query_date)
+        symbols = [symbol] if symbol else None
         
-        # Start with filtering by date
-        queryset = StockPrice.objects.filter(date=query_date)
-        
-        # Filter by symbol if provided
-        if symbol:
-            queryset = queryset.filter(symbol=symbol)
-        
-        # Get distinct symbols for processing
-        symbols = queryset.values_list('symbol', flat=True).distinct()
-        
-        # Initialize empty result list
-        result = []
+        if query_times:
+            return Response({
+                t.strftime('%H:%M:%S'): StockPriceSerializer(index.as_of(t, symbols), many=True).data
+                for t in query_times
+            })
         
-        # If time is provided, find the closest time for each symbol
-        if time_str:
-            try:
-                query_time = datetime.strptime(time_str, "%H:%M:%S").time()
-                
-                # Process each symbol individually
-                for sym in symbols:
-                    # For each symbol, get prices ordered by time
-                    symbol_prices = queryset.filter(symbol=sym).order_by('time')
-                    
-                    # Try to find price before or at the requested time
-                    before_prices = symbol_prices.filter(time__lte=query_time).order_by('-time')
-                    if before_prices.exists():
-                        result.append(before_prices.first())
-                    else:
-                        # If no earlier price, get the earliest available
-                        earliest = symbol_prices.first()
-                        if earliest:
-                            result.append(earliest)
-                
-            except ValueError:
-                return Response(
-                    {"error": "Invalid time format. Use HH:MM:SS"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        # If no time specified or if latest_only is true, get the latest price for each symbol
-        elif latest_only or not time_str:
-            # Process each symbol individually
-            for sym in symbols:
-                # For each symbol, get the latest price by time
-                latest_price = queryset.filter(symbol=sym).order_by('-time').first()
-                if latest_price:
-                    result.append(latest_price)
-        # If latest_only is false and no time specified, return all records (filtered by symbol if provided)
+        if query_time:
+            result = index.as_of(query_time, symbols)
         else:
-            # Convert queryset to list for consistency
-            result = list(queryset)
+            # No time specified: the latest price for each symbol
+            result = index.latest(symbols)
         
-        # Ensure we have no duplicates by converting to a dict with symbol as key
-        # This is a safeguard against any logic issues that might produce duplicates
-        unique_results = {}
-        for item in result:
-            if item.symbol not in unique_results or unique_results[item.symbol].time < item.time:
-                unique_results[item.symbol] = item
-        
-        # Convert back to a list and sort by symbol
-        final_result = sorted(unique_results.values(), key=lambda x: x.symbol)
-        
-        serializer = StockPriceSerializer(final_result, many=True)
+        serializer = StockPriceSerializer(result, many=True)
         return Response(serializer.data)
     
-    except ValueError:
-        return Response(
-            {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
     except Exception as e:
         return Response(
             {"error": str(e)}, 
@@ -277,7 +257,22 @@ class CompanyViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['symbol', 'name', 'sector', 'industry']
     ordering_fields = ['symbol', 'name', 'sector', 'listed_date']
 
+def _company_versions(symbol):
+    company_version = data_versions.company_version(symbol.upper())
+    if company_version is None:
+        return None  # Unknown company: no validators, the view returns 404
+    return company_version, data_versions.ticks_version()
+
+def _company_etag(request, symbol):
+    versions = _company_versions(symbol)
+    return _etag('company', symbol.upper(), *versions) if versions else None
+
+def _company_last_modified(request, symbol):
+    versions = _company_versions(symbol)
+    return max(version for version in versions if version) if versions else None
+
 @api_view(['GET'])
+@condition(etag_func=_company_etag, last_modified_func=_company_last_modified)
 def company_detail(request, symbol):
     """
     Get detailed information about a specific company including latest stock data
@@ -291,7 +286,7 @@ def company_detail(request, symbol):
         )
     
     # Get the latest stock price
-    latest_price = StockPrice.objects.filter(symbol=symbol.upper()).order_by('-date', '-time').first()
+    latest_price = LatestPrice.objects.filter(symbol=symbol.upper()).first()
     
     # Serialize the company data
     company_data = CompanySerializer(company).data
@@ -310,7 +305,41 @@ def company_detail(request, symbol):
     
     return Response(company_data)
 
+def _historical_versions(request, symbol):
+    """Stamps behind a historical response, None when validators don't apply"""
+    params = request.GET
+    if params.get('refresh', 'false').lower() == 'true' or params.get('cache', 'true').lower() != 'true':
+        return None
+    # Ranges end today, so the date is part of the version
+    time_range = params.get('range', '1month')
+    return time_range, params.get('format', ''), date.today(), _historical_data_version(symbol.upper(), time_range)
+
+def _if_none_match_matches(request, etag):
+    """Weak comparison of If-None-Match against an ETag, as django.utils.cache does"""
+    tags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return tags == ['*'] or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in tags)
+
+def _historical_etag(request, symbol):
+    versions = _historical_versions(request, symbol)
+    if not versions:
+        return None
+    etag = _etag('historical', symbol.upper(), *versions)
+    # A 304 skips the view, so a range past its soft TTL is queued for refresh
+    # here; the ETag moves once the refresh stores new prices
+    time_range = versions[0]
+    if time_range in MSEHistoricalService.DEFAULT_CACHE_TTLS and \
+            _if_none_match_matches(request, etag) and \
+            cache.get(MSEHistoricalService.historical_cache_key(symbol.upper(), time_range)) is None:
+        historical_revalidator.submit(symbol.upper(), time_range)
+    return etag
+
+def _historical_last_modified(request, symbol):
+    versions = _historical_versions(request, symbol)
+    return versions[-1] if versions else None
+
 @api_view(['GET'])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer])
+@condition(etag_func=_historical_etag, last_modified_func=_historical_last_modified)
 def historical_prices(request, symbol):
     """
     Get historical price data for a stock with smart caching
@@ -319,6 +348,12 @@ def historical_prices(request, symbol):
     - range: Time range (1month, 3months, 6months, 1year, 2years, 5years)
     - cache: Whether to use cached data (true/false, default: true)
     - refresh: Force refresh data from source (true/false, default: false)
+    - format: 'columnar' returns parallel arrays (dates, close, ...) built from
+      the stored prices, leaving out columns that are empty for the range
+    
+    Once a range's soft TTL has passed, the last good payload (or the stored
+    prices) is returned with source 'stale' and an Age header while a
+    background refresh runs; only data past the hard TTL blocks on MSE.
     """
     # Process query parameters
     time_range = request.query_params.get('range', '1month')
@@ -335,31 +370,63 @@ def historical_prices(request, symbol):
         time_range = '1month'
         logger.warning(f"Invalid time range. Using default '1month'.")
       # Generate cache key (different strategy for intraday)
+    service = MSEHistoricalService()
     if time_range == '1day':
         # For intraday, cache by hour to get fresh data every hour
         current_hour = datetime.now().hour
-        cache_key = f"intraday_{symbol}_{date.today().isoformat()}_{current_hour}"
+        cache_key = versioned_key('intraday', symbol, date.today().isoformat(), current_hour)
     else:
-        cache_key = f"historical_{symbol}_{time_range}_{date.today().isoformat()}"
+        cache_key = service.historical_cache_key(symbol, time_range)
+    
+    version = _historical_data_version(symbol, time_range)
+    if request.accepted_renderer.format == 'columnar':
+        return _columnar_historical_prices(request, service, symbol, time_range, cache_key, version,
+                                           use_cache and not refresh)
+    stale_payload = None
     
-    # Check cache first (unless refresh is forced)
+    # Check cache first (unless refresh is forced); hits are served as pre-rendered JSON
     if use_cache and not refresh:
-        cached_data = cache.get(cache_key)
-        if cached_data:
+        payload = payload_cache.get(cache_key, version)
+        if payload is None:
+            cached_data = cache.get(cache_key)
+            if cached_data:
+                soft_ttl = service.cache_ttls(time_range)[0]
+                payload = payload_cache.put(cache_key, version, cached_data, _json_renderer(),
+                                            soft_ttl - _payload_age(cached_data))
+        if payload is not None:
             logger.info(f"Returning cached data for {symbol} {time_range}")
-            cached_data['source'] = 'cache'
-            return Response(cached_data)
+            return _rendered_response(request, payload, 'cache')
         
-        # Check database cache for older data
-        db_data = get_cached_historical_data(symbol, time_range)
-        if db_data.status_code == 200:
-            logger.info(f"Returning database cached data for {symbol} {time_range}")
-            return db_data
+        # Past the soft TTL: serve the last good payload, or the database copy,
+        # while a background refresh fetches a fresh one
+        if time_range != '1day':
+            hard_ttl = service.cache_ttls(time_range)[1]
+            stale_key = service.stale_cache_key(symbol, time_range)
+            stale_payload = payload_cache.get(stale_key, version)
+            if stale_payload is None:
+                stale_data = cache.get(stale_key)
+                if not stale_data:
+                    db_data = get_cached_historical_data(symbol, time_range)
+                    if db_data.status_code == 200:
+                        stale_data = db_data.data
+                if stale_data:
+                    stale_payload = payload_cache.put(stale_key, version, stale_data, _json_renderer(), hard_ttl)
+            
+            if stale_payload:
+                age = payload_cache.age(stale_payload)
+                if age <= hard_ttl:
+                    historical_revalidator.submit(symbol, time_range)
+                    logger.info(f"Returning stale data for {symbol} {time_range} ({age}s old), refreshing in background")
+                    return _rendered_response(request, stale_payload, 'stale', age)
     
     # Fetch fresh data from MSE website
-    service = MSEHistoricalService()
     historical_data = service.get_historical_data(symbol, time_range)
     
+    if not historical_data and stale_payload:
+        # Past the hard TTL, but older data beats none when MSE is unreachable
+        logger.warning(f"Could not refresh {symbol} {time_range}, returning stale data")
+        return _rendered_response(request, stale_payload, 'stale', payload_cache.age(stale_payload))
+    
     if not historical_data:
         logger.warning(f"Could not retrieve historical data for {symbol} from service")
         return Response({
@@ -367,15 +434,131 @@ def historical_prices(request, symbol):
             "message": "Data may not be available for this symbol or time range"
         }, status=status.HTTP_404_NOT_FOUND)
     
-    # Save to database for future caching
-    try:
-        saved_count = service.save_to_database(symbol, historical_data)
-        logger.info(f"Saved {saved_count} data points to database for {symbol}")
-    except Exception as e:
-        logger.error(f"Error saving to database: {e}")
+    # Return the fresh data (the service has already stored it), rendered like a
+    # cache hit so the body never depends on where the data came from; the next
+    # hit on the service's cache entry stores the rendered bytes
+    payload = payload_cache.render(historical_data, _json_renderer())
+    return _rendered_response(request, payload, historical_data.get('source'))
+
+# HistoricalPrice fields and the columns they are returned as with ?format=columnar
+COLUMNAR_FIELDS = (
+    ('date', 'dates'),
+    ('open_price', 'open'),
+    ('high', 'high'),
+    ('low', 'low'),
+    ('close_price', 'close'),
+    ('volume', 'volume'),
+    ('turnover', 'turnover'),
+)
+
+def _columnar_historical_prices(request, service, symbol, time_range, cache_key, version, use_cache):
+    """
+    historical_prices with ?format=columnar, served from HistoricalPrice.
     
-    # Return the fresh data
-    return Response(historical_data)
+    The fresh row-format cache entry doubles as the freshness check: while
+    it exists the stored prices are current, past it they are served as
+    stale while the background refresh brings them up to date. Rows older
+    than the range's hard TTL are refreshed before answering, as in the row
+    format.
+    """
+    if time_range == '1day':
+        return Response({
+            "error": "Columnar format is not available for intraday data"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    columnar_key = f"{cache_key}:columnar"
+    if use_cache:
+        payload = payload_cache.get(columnar_key, version)
+        if payload is not None:
+            return _rendered_response(request, payload, 'cache')
+    
+    source = 'cache'
+    if not use_cache or not HistoricalPrice.objects.filter(symbol=symbol).exists():
+        historical_data = service.get_historical_data(symbol, time_range)
+        source = (historical_data or {}).get('source', 'cache')
+    elif cache.get(cache_key) is None:
+        source = 'stale'
+    
+    data = _columnar_historical_data(symbol, time_range)
+    if source == 'stale':
+        stale_payload = payload_cache.render(data, _json_renderer()) if data else None
+        age = payload_cache.age(stale_payload) if stale_payload else None
+        if stale_payload and age <= service.cache_ttls(time_range)[1]:
+            historical_revalidator.submit(symbol, time_range)
+            return _rendered_response(request, stale_payload, 'stale', age)
+        
+        # Past the hard TTL: block on MSE, falling back to the old rows if it fails
+        historical_data = service.get_historical_data(symbol, time_range)
+        if not historical_data and stale_payload:
+            logger.warning(f"Could not refresh {symbol} {time_range}, returning stale data")
+            return _rendered_response(request, stale_payload, 'stale', age)
+        source = (historical_data or {}).get('source', 'cache')
+        data = _columnar_historical_data(symbol, time_range)
+    
+    if data is None:
+        return Response({
+            "error": f"No historical data found for {symbol} in {time_range} range"
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    # Keyed by the version the rows were read at, which moves with any save above
+    payload = payload_cache.put(columnar_key, _historical_data_version(symbol, time_range), data,
+                                _json_renderer(), service.cache_ttls(time_range)[0])
+    return _rendered_response(request, payload, source)
+
+def _columnar_historical_data(symbol, time_range):
+    """Parallel arrays of a symbol's stored prices for a range, None if there are none"""
+    fields = [field for field, _ in COLUMNAR_FIELDS]
+    rows = list(
+        HistoricalPrice.objects
+        .filter(symbol=symbol, date__gte=_range_start_date(time_range))
+        .order_by('date')
+        .values_list(*fields, 'last_updated')
+    )
+    if not rows:
+        return None
+    
+    *columns, last_updated = zip(*rows)
+    data = {'symbol': symbol, 'time_range': time_range, 'data_points': len(rows)}
+    for (_, name), values in zip(COLUMNAR_FIELDS, columns):
+        # Scraped prices often have no open/high/low/volume
+        if any(value is not None for value in values):
+            data[name] = values
+    # When the newest of these rows was fetched from MSE
+    data['retrieved_at'] = timezone.localtime(max(last_updated)).replace(tzinfo=None).isoformat()
+    return data
+
+def _historical_data_version(symbol, time_range):
+    """Data-version stamp a historical response for symbol and range depends on"""
+    if time_range == '1day':
+        return data_versions.ticks_version()
+    return data_versions.historical_version(symbol)
+
+def _json_renderer():
+    """The configured JSON renderer, used for payloads rendered ahead of the request"""
+    return next(renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer.format == 'json')
+
+def _source_headers(source, retrieved_at):
+    headers = {'X-Data-Source': source} if source else {}
+    if retrieved_at:
+        headers['X-Retrieved-At'] = retrieved_at
+    return headers
+
+def _rendered_response(request, payload, source, age=None):
+    """Serve a pre-rendered payload; other renderers (browsable API) get it decoded"""
+    if isinstance(request.accepted_renderer, JSONRenderer):
+        return payload_cache.response(payload, source, request.accepted_renderer.media_type, age)
+    headers = _source_headers(source, payload.retrieved_at)
+    if age is not None:
+        headers['Age'] = str(age)
+    return Response(json.loads(payload.body), headers=headers)
+
+def _payload_age(payload):
+    """Seconds since a historical payload's retrieved_at"""
+    try:
+        retrieved_at = datetime.fromisoformat(payload['retrieved_at'])
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return max(0, int((datetime.now() - retrieved_at).total_seconds()))
 
 def _get_expected_data_points(time_range):
     """Get expected number of data points for a time range (assuming ~20 trading days per month)"""
@@ -389,35 +572,37 @@ def _get_expected_data_points(time_range):
     }
     return expected_map.get(time_range, 22)
 
-def get_cached_historical_data(symbol, time_range):
-    """Get historical data from database cache"""
-    # For intraday (1day), don't use database cache - always fetch fresh
-    if time_range == '1day':
-        return Response({
-            "error": "No cached intraday data available"
-        }, status=status.HTTP_404_NOT_FOUND)
-    
-    # Map time ranges to date ranges
+def _range_start_date(time_range):
+    """First date of a historical range ending today"""
     today = datetime.now().date()
     
     if time_range == '1month':
-        start_date = today - timedelta(days=31)
+        return today - timedelta(days=31)
     elif time_range == '3months':
-        start_date = today - timedelta(days=92)
+        return today - timedelta(days=92)
     elif time_range == '6months':
-        start_date = today - timedelta(days=183)
+        return today - timedelta(days=183)
     elif time_range == '1year':
-        start_date = today - timedelta(days=366)
+        return today - timedelta(days=366)
     elif time_range == 'ytd':
-        start_date = datetime(today.year, 1, 1).date()
+        return datetime(today.year, 1, 1).date()
     elif time_range == '2years':
-        start_date = today - timedelta(days=731)
+        return today - timedelta(days=731)
     elif time_range == '3years':
-        start_date = today - timedelta(days=1096)
+        return today - timedelta(days=1096)
     elif time_range == '5years':
-        start_date = today - timedelta(days=1827)
-    else:
-        start_date = today - timedelta(days=31)
+        return today - timedelta(days=1827)
+    return today - timedelta(days=31)
+
+def get_cached_historical_data(symbol, time_range):
+    """Get historical data from database cache"""
+    # For intraday (1day), don't use database cache - always fetch fresh
+    if time_range == '1day':
+        return Response({
+            "error": "No cached intraday data available"
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    start_date = _range_start_date(time_range)
     
     # Get historical prices from database
     prices = (
@@ -452,7 +637,10 @@ def get_cached_historical_data(symbol, time_range):
     
     # Format the response
     stock_prices = []
+    last_updated = None
     for price in prices:
+        if last_updated is None or price.last_updated > last_updated:
+            last_updated = price.last_updated
         stock_prices.append({
             'date': price.date.isoformat(),
             'open': float(price.open_price) if price.open_price else None,
@@ -470,7 +658,8 @@ def get_cached_historical_data(symbol, time_range):
         'company': company_info,
         'time_range': time_range,
         'stock_prices': stock_prices,
-        'retrieved_at': datetime.now().isoformat(),
+        # When the newest of these rows was fetched from MSE
+        'retrieved_at': timezone.localtime(last_updated).replace(tzinfo=None).isoformat(),
         'data_points': len(stock_prices),
         'source': 'cache'
     }
@@ -511,42 +700,44 @@ def unsubscribe(request, token):
     subscriber.save()
     return Response({'message': 'Unsubscribed successfully from daily market reports!'})
 
+def _market_session(current_time):
+    """(status, session) of the MSE trading day at current_time"""
+    current_time_value = current_time.hour * 60 + current_time.minute
+    
+    # Check if it's weekend
+    if current_time.weekday() in [5, 6]:  # Saturday or Sunday
+        return "Closed (Weekend)", "Weekend"
+    
+    # MSE market schedule (in minutes since midnight)
+    if 9*60 <= current_time_value < 9*60+30:  # 9:00 - 9:30
+        return "Open", "Pre-Open"
+    elif 9*60+30 <= current_time_value < 14*60+30:  # 9:30 - 14:30
+        return "Open", "Trading"
+    elif 14*60+30 <= current_time_value < 15*60:  # 14:30 - 15:00
+        return "Open", "Close"
+    elif 15*60 <= current_time_value <= 17*60:  # 15:00 - 17:00
+        return "Open", "Post-Close"
+    return "Closed", "After Hours"
+
+def _market_status_etag(request):
+    return _etag('market-status', *_market_session(datetime.now()), data_versions.ticks_version())
+
 @api_view(['GET'])
+@condition(etag_func=_market_status_etag, last_modified_func=_ticks_last_modified)
 def market_status(request):
     """
     Get current market status based on time and latest data
+    
+    The ETag covers the session and the latest scrape, so a 304 means
+    neither has changed (current_time is not part of it).
     """
     # Get current time
     current_time = datetime.now()
     current_weekday = current_time.weekday()
-    current_hour = current_time.hour
-    current_minute = current_time.minute
-    current_time_value = current_hour * 60 + current_minute
-    
-    # Check if it's weekend
-    if current_weekday in [5, 6]:  # Saturday or Sunday
-        status = "Closed (Weekend)"
-        session = "Weekend"
-    else:
-        # MSE market schedule (in minutes since midnight)
-        if 9*60 <= current_time_value < 9*60+30:  # 9:00 - 9:30
-            status = "Open"
-            session = "Pre-Open"
-        elif 9*60+30 <= current_time_value < 14*60+30:  # 9:30 - 14:30
-            status = "Open"
-            session = "Trading"
-        elif 14*60+30 <= current_time_value < 15*60:  # 14:30 - 15:00
-            status = "Open"
-            session = "Close"
-        elif 15*60 <= current_time_value <= 17*60:  # 15:00 - 17:00
-            status = "Open"
-            session = "Post-Close"
-        else:
-            status = "Closed"
-            session = "After Hours"
+    status, session = _market_session(current_time)
     
     # Get the latest market data to see last update
-    latest_price = StockPrice.objects.order_by('-date', '-time').first()
+    latest_price = LatestPrice.objects.order_by('-date', '-time').first()
     last_update = None
     market_data_status = "Unknown"
     
@@ -569,10 +760,14 @@ def background_status(request):
     """Get the status of background tasks"""
     try:
         from .background_tasks import get_collector_status
+        from accounts.middleware import api_key_cache
         status = get_collector_status()
         
         return Response({
             'background_tasks': status,
+            'api_key_cache': api_key_cache.stats(),
+            'historical_revalidations_pending': historical_revalidator.pending(),
+            'cache': cache.stats() if hasattr(cache, 'stats') else None,
             'current_time': datetime.now().isoformat(),
             'message': 'Background cache refresh running automatically' if status['running'] else 'Background tasks not running'
         })